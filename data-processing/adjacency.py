@@ -0,0 +1,149 @@
+import struct
+import zipfile
+import numpy as np
+from scipy import sparse
+
+#----------------------
+# Save Adjacency Function
+#----------------------
+def save_adjacency(path,
+                   row,
+                   col,
+                   n_regions):
+
+    """
+
+    This function is used to save a region adjacency as a scipy CSR .npz.
+    The archive is written uncompressed so `load_adjacency` can memory-map
+    its arrays instead of copying them.
+
+    Arg:
+        - path: output .npz path
+        - row, col: indices of intersecting region pairs
+        - n_regions: number of regions
+
+    """
+
+    data = np.ones(len(row), dtype='int8')
+    geo_A = sparse.csr_matrix((data, (row, col)), shape=(n_regions, n_regions))
+    geo_A.sum_duplicates()
+    sparse.save_npz(path, geo_A, compressed=False)
+
+#----------------------
+# Load Adjacency Function
+#----------------------
+def mmap_npz(path):
+
+    """
+
+    This function is used to memory-map every array stored (uncompressed)
+    in an .npz archive. Compressed members are loaded normally.
+
+    """
+
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            name = info.filename[:-len('.npy')]
+            if info.compress_type != zipfile.ZIP_STORED:
+                arrays[name] = np.load(archive.open(info))
+                continue
+
+            ## skip the local file header to the .npy payload
+            f.seek(info.header_offset)
+            header = f.read(30)
+            name_length, extra_length = struct.unpack('<HH', header[26:30])
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+
+            ## parse the .npy header
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0): shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else: shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if dtype.hasobject or dtype.kind == 'U' or np.prod(shape) == 0:
+                arrays[name] = np.load(archive.open(info))
+            else:
+                arrays[name] = np.memmap(path,
+                                         dtype=dtype,
+                                         mode='r',
+                                         shape=shape,
+                                         offset=f.tell(),
+                                         order='F' if fortran_order else 'C')
+    return arrays
+
+def load_adjacency(path,
+                   mmap=True):
+
+    """
+
+    This function is used to load a CSR adjacency saved by `save_adjacency`.
+    With mmap=True the index arrays are shared through the page cache, so
+    many processes can open the same file without copying it.
+
+    """
+
+    if mmap: arrays = mmap_npz(path)
+    else: arrays = dict(np.load(path))
+    return Adjacency(arrays['indptr'], arrays['indices'], tuple(arrays['shape']))
+
+class Adjacency():
+
+    """
+    Neighbor queries over a CSR region adjacency
+    """
+
+    def __init__(self,
+                 indptr,
+                 indices,
+                 shape):
+
+        self.indptr = indptr
+        self.indices = indices
+        self.shape = shape
+        self._degrees = None
+
+    def __len__(self):
+        return self.shape[0]
+
+    def neighbors(self, region):
+
+        ## intersecting regions, without the region itself
+        neighbors = self.indices[self.indptr[region]:self.indptr[region+1]]
+        return np.asarray(neighbors[neighbors != region])
+
+    def k_hop(self,
+              region,
+              k):
+
+        ## regions reachable within k hops (region itself excluded)
+        visited = np.zeros(len(self), dtype='bool')
+        visited[region] = True
+        frontier = np.array([region])
+        for _ in range(k):
+            starts = np.asarray(self.indptr[frontier])
+            lengths = np.asarray(self.indptr[frontier+1]) - starts
+            offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+            reached = np.unique(self.indices[offsets + np.arange(lengths.sum())])
+            frontier = reached[~visited[reached]]
+            if len(frontier) == 0: break
+            visited[frontier] = True
+        visited[region] = False
+        return np.where(visited)[0]
+
+    def degrees(self):
+        if self._degrees is None:
+            rows = np.repeat(np.arange(len(self)), np.diff(self.indptr))
+            self_loops = np.bincount(rows[np.asarray(self.indices) == rows], minlength=len(self))
+            self._degrees = np.diff(self.indptr) - self_loops
+        return self._degrees
+
+    def degree_stats(self):
+        degrees = self.degrees()
+        return {'min': int(degrees.min()),
+                'max': int(degrees.max()),
+                'mean': float(degrees.mean()),
+                'median': float(np.median(degrees)),
+                'isolated': int(np.sum(degrees == 0))}
+
+    def to_sparse(self):
+        data = np.ones(len(self.indices), dtype='int8')
+        return sparse.csr_matrix((data, self.indices, self.indptr), shape=self.shape)
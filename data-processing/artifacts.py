@@ -0,0 +1,107 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+
+#----------------------
+# Artifact Cache
+#----------------------
+## bump when the geodata / adjacency / linkage code changes
+ARTIFACT_VERSION = 3
+REFERENCES_LOCK = threading.Lock()
+
+def file_digest(path):
+
+    """
+    This function is used to hash the content of a file (sha1).
+    """
+
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1<<24), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def artifact_key(*parts):
+
+    """
+
+    This function is used to get the content address of an artifact from
+    its inputs (bytes or anything with a stable str, e.g. file digests,
+    WKB, zones) and ARTIFACT_VERSION.
+
+    """
+
+    digest = hashlib.sha1(f'v{ARTIFACT_VERSION}'.encode())
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+    return digest.hexdigest()[:16]
+
+def artifact_dir(city,
+                 kind,
+                 key):
+
+    """
+
+    This function is used to get the folder of an artifact, shared by every
+    dataset of a city: D:/disaggregation-data/{city}/artifacts/{kind}-{key}/
+
+    """
+
+    return f'D:/disaggregation-data/{city}/artifacts/{kind}-{key}/'
+
+def build_artifact(path,
+                   build):
+
+    """
+
+    This function is used to build an artifact folder once: `build` writes
+    the files into a temporary folder, which is then renamed to `path`, so a
+    partially written artifact is never used.
+
+    """
+
+    if os.path.isdir(path): return
+    tmp = path.rstrip('/') + f'.tmp-{os.getpid()}-{threading.get_ident()}/'
+    if os.path.isdir(tmp): shutil.rmtree(tmp)
+    os.makedirs(tmp)
+    build(tmp)
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        ## built concurrently by another process
+        if not os.path.isdir(path): raise
+        shutil.rmtree(tmp)
+
+def link_artifact(data_name,
+                  source,
+                  name):
+
+    """
+
+    This function is used to reference an artifact file from a dataset: it
+    is hard-linked (copied if linking fails) to
+    D:/disaggregation-data/{data_name}/{name}, and the source recorded in
+    the dataset's artifacts.json.
+
+    """
+
+    root = f'D:/disaggregation-data/{data_name}/'
+    target = root + name
+    if os.path.exists(target):
+        if os.path.samefile(source, target): return
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+    with REFERENCES_LOCK:
+        references = {}
+        if os.path.isfile(root+'artifacts.json'):
+            with open(root+'artifacts.json') as f:
+                references = json.load(f)
+        references[name] = os.path.abspath(source)
+        with open(root+'artifacts.json', 'w') as f:
+            json.dump(references, f, indent=1)
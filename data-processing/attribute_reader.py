@@ -0,0 +1,51 @@
+import os
+import json
+import numpy as np
+
+#----------------------
+# Attribute Store Reader
+#----------------------
+## numpy only: also loaded by the models (see `load_attribute_reader` in
+## models/utils.py), whose environment has no scipy; the store is written
+## by `save_attribute_store`
+def load_store_index(path):
+    with open(path+'index.json') as f:
+        return json.load(f)
+
+def attribute_rows(root,
+                   name,
+                   start=0,
+                   stop=None,
+                   dtype='float32'):
+
+    """
+
+    This function is used to load the rows [start, stop) of the attributes
+    of one resolution as a dense array, reading only the months of the
+    attribute store overlapping them (attributes/{name}.npy for datasets
+    without store).
+
+    Arg:
+        - root: dataset folder, e.g. D:/disaggregation-data/taxi/
+        - dtype: float32 (default) or float64
+
+    """
+
+    path = root+'attributes/store/'
+    if not os.path.isfile(path+'index.json'):
+        return np.array(np.load(root+f'attributes/{name}.npy', mmap_mode='r')[start:stop], dtype=dtype)
+
+    index = load_store_index(path)
+    if stop is None: stop = index['n_hours']
+    start, stop = max(start, 0), min(stop, index['n_hours'])
+    rows = np.zeros((max(stop-start, 0), index['levels'][name]), dtype=dtype)
+    for month, month_start, month_stop in index['months']:
+        if month_stop <= start or month_start >= stop: continue
+        lo, hi = max(month_start, start), min(month_stop, stop)
+
+        ## scatter the CSR rows [lo, hi) of the month
+        arrays = np.load(path+f'{name}/{month}.npz')
+        indptr = arrays['indptr'][lo-month_start:hi-month_start+1]
+        row_index = np.repeat(np.arange(lo, hi)-start, np.diff(indptr))
+        rows[row_index, arrays['indices'][indptr[0]:indptr[-1]]] = arrays['data'][indptr[0]:indptr[-1]]
+    return rows
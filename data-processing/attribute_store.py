@@ -0,0 +1,107 @@
+import os
+import json
+import shutil
+import numpy as np
+from scipy import sparse
+from attribute_reader import load_store_index, attribute_rows
+
+#----------------------
+# Attribute Store
+#----------------------
+## bump when the store layout changes
+STORE_VERSION = 1
+
+def save_attribute_store(path,
+                         names,
+                         attributes,
+                         hours):
+
+    """
+
+    This function is used to save attributes as a sparse attribute store in
+    `path` (e.g. attributes/store/): for every resolution, the counts of
+    every month as an integer CSR matrix ({name}/{YYYY-MM}.npz), and an
+    index.json with the rows of every month.
+
+    Arg:
+        - attributes: (hours x regions) counts of every resolution, sparse or dense
+        - hours: hour bucket (datetime64[h]) of every row, sorted
+
+    """
+
+    months, starts = np.unique(hours.astype('datetime64[M]'), return_index=True)
+    stops = np.append(starts[1:], len(hours)).astype('int64')
+    if os.path.isdir(path): shutil.rmtree(path)
+
+    levels = {}
+    for name, X in zip(names, attributes):
+        X = sparse.csr_matrix(X)
+        X.eliminate_zeros()
+        levels[name] = X.shape[1]
+        os.makedirs(path+name)
+        for month, start, stop in zip(months, starts, stops):
+            chunk = X[start:stop]
+            np.savez(path+f'{name}/{month}.npz',
+                     data=chunk.data.astype('int32'),
+                     indices=chunk.indices.astype('int32'),
+                     indptr=chunk.indptr.astype('int64'),
+                     shape=np.array(chunk.shape))
+
+    ## index last: an interrupted save has no index
+    with open(path+'index.json', 'w') as f:
+        json.dump({'version': STORE_VERSION,
+                   'n_hours': len(hours),
+                   'levels': levels,
+                   'months': [[str(month), int(start), int(stop)] for month, start, stop in zip(months, starts, stops)]}, f, indent=1)
+
+def load_store_month(path,
+                     name,
+                     month):
+
+    """
+    This function is used to load the counts of one month of a resolution as a CSR matrix.
+    """
+
+    arrays = np.load(path+f'{name}/{month}.npz')
+    return sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=tuple(arrays['shape']))
+
+def attribute_matrix(root,
+                     name):
+
+    """
+    This function is used to load all the attributes of one resolution as one CSR matrix (for merging new counts).
+    """
+
+    path = root+'attributes/store/'
+    if not os.path.isfile(path+'index.json'):
+        return sparse.csr_matrix(np.load(root+f'attributes/{name}.npy'))
+    index = load_store_index(path)
+    months = [load_store_month(path, name, month) for month, _, _ in index['months']]
+    if not months: return sparse.csr_matrix((0, index['levels'][name]))
+    return sparse.vstack(months, format='csr').astype('float')
+
+def load_attributes(root,
+                    names,
+                    start=None,
+                    stop=None,
+                    dtype='float32'):
+
+    """
+
+    This function is used to load the attributes of several resolutions
+    over a date range [start, stop) as dense (hours x regions) arrays.
+
+    Arg:
+        - root: dataset folder, e.g. D:/disaggregation-data/taxi/
+        - names: resolutions, e.g. ['block', 'extreme']
+        - start, stop: first & end date/hour (datetime64 or strings, e.g.
+                       '2016-12-01'), None for the first & last hours
+
+    Returns the hours (datetime64[h]) & {name: attributes}.
+
+    """
+
+    hours = np.load(root+'attributes/hours.npy')
+    lo = 0 if start is None else int(np.searchsorted(hours, np.datetime64(start, 'h')))
+    hi = len(hours) if stop is None else int(np.searchsorted(hours, np.datetime64(stop, 'h')))
+    return hours[lo:hi], {name: attribute_rows(root, name, lo, hi, dtype) for name in names}
@@ -0,0 +1,249 @@
+import json
+import shutil
+import argparse
+import platform
+import subprocess
+from datetime import datetime
+from utils import *
+
+#----------------------
+# Scales
+#----------------------
+## regions per level (coarse to fine) & number of trips;
+## 'large' is about the size of the NYC hierarchy (see models/config.json)
+SCALES = {
+    'small': {'regions': [4, 16, 64, 256, 768], 'points': 100000},
+    'medium': {'regions': [10, 32, 282, 1000, 3000], 'points': 1000000},
+    'large': {'regions': [10, 32, 282, 3733, 10994], 'points': 10000000},
+}
+BOUNDS = (-74.02, 40.70, -73.91, 40.88)
+
+#----------------------
+# Synthetic City
+#----------------------
+def split_region(polygon,
+                 n_parts,
+                 kind,
+                 rng):
+
+    """
+
+    This function is used to split one region into about `n_parts`
+    regions: a grid of its bounding box (kind='grid') or the Voronoi cells
+    of random points in it (kind='voronoi'), clipped to the region.
+
+    """
+
+    minx, miny, maxx, maxy = polygon.bounds
+    if kind == 'grid':
+        ## nx x ny = n_parts, as square as possible
+        nx = max(n for n in range(1, int(np.sqrt(n_parts))+1) if n_parts % n == 0)
+        ny = n_parts//nx
+        xs = np.linspace(minx, maxx, nx+1)
+        ys = np.linspace(miny, maxy, ny+1)
+        cells = shapely.box(xs[:-1,None], ys[None,:-1], xs[1:,None], ys[None,1:]).ravel()
+    else:
+        seeds = []
+        while len(seeds) < n_parts:
+            points = shapely.points(rng.uniform(minx, maxx, 2*n_parts), rng.uniform(miny, maxy, 2*n_parts))
+            seeds.extend(points[shapely.contains(polygon, points)])
+        cells = shapely.get_parts(shapely.voronoi_polygons(shapely.multipoints(seeds[:n_parts]), extend_to=polygon))
+    parts = shapely.get_parts(shapely.intersection(cells, polygon))
+    return parts[(shapely.get_type_id(parts) == 3) & (shapely.area(parts) > 0)]
+
+def synthetic_city(regions,
+                   kind='grid',
+                   bounds=BOUNDS,
+                   seed=0):
+
+    """
+
+    This function is used to generate a nested hierarchy of regions: every
+    level splits each region of the level above (see `split_region`), so
+    each level has about `regions[i]` regions.
+
+    Returns a list of polygon arrays, coarse to fine.
+
+    """
+
+    rng = np.random.default_rng(seed)
+    levels = [np.array([shapely.box(*bounds)])]
+    for n_regions in regions:
+        n_parts = max(1, int(round(n_regions/len(levels[-1]))))
+        levels.append(np.concatenate([split_region(polygon, n_parts, kind, rng) for polygon in levels[-1]]))
+    return levels[1:]
+
+def synthetic_trips(n_points,
+                    bounds=BOUNDS,
+                    n_days=30,
+                    n_hotspots=50,
+                    seed=0):
+
+    """
+
+    This function is used to generate trips: half uniform over the city,
+    half around random hotspots, with uniform timestamps over `n_days` days.
+
+    """
+
+    rng = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = bounds
+    n_uniform = n_points//2
+    hotspots = rng.integers(0, n_hotspots, n_points-n_uniform)
+    centers = np.stack([rng.uniform(minx, maxx, n_hotspots), rng.uniform(miny, maxy, n_hotspots)], axis=1)
+    longs = np.concatenate([rng.uniform(minx, maxx, n_uniform), centers[hotspots,0] + rng.normal(0, (maxx-minx)/50, len(hotspots))])
+    lats = np.concatenate([rng.uniform(miny, maxy, n_uniform), centers[hotspots,1] + rng.normal(0, (maxy-miny)/50, len(hotspots))])
+    timestamps = np.datetime64('2016-01-01T00:00:00') + rng.integers(0, n_days*24*3600, n_points).astype('timedelta64[s]')
+    return longs, lats, timestamps
+
+def write_city(data_name,
+               levels,
+               names,
+               bounds=BOUNDS):
+
+    """
+
+    This function is used to write a synthetic city as raw data, like the
+    D:/disaggregation-data/{data_name}/raw-data/ csv files: one file per
+    level and a one-zone boundary file.
+
+    """
+
+    root = f'D:/disaggregation-data/{data_name}/'
+    if os.path.isdir(root): shutil.rmtree(root)
+    for folder in ['raw-data', 'geodata', 'adjacencies', 'linkages', 'attributes', 'img-data']:
+        os.makedirs(root+folder)
+    boundary = shapely.multipolygons([shapely.box(*bounds)])
+    pd.DataFrame({'LocationID': [1], 'the_geom': [boundary.wkt]}).to_csv(root+'raw-data/zones.csv', index=False)
+    for polygons, name in zip(levels, names):
+        pd.DataFrame({'the_geom': shapely.to_wkt(polygons)}).to_csv(root+f'raw-data/{name}.csv', index=False)
+
+#----------------------
+# Benchmark
+#----------------------
+def benchmark(kind,
+              regions,
+              n_points,
+              n_days=30,
+              data_name='benchmark'):
+
+    """
+
+    This function is used to time every stage on one synthetic city: geodata
+    (cold), extreme split, linkages, attributes (flat & hierarchical),
+    attribute store, rasterization, count images and splits.
+
+    Returns the timings (seconds) & peak memory (MB) of every stage.
+
+    """
+
+    timings = {}
+    first_stage = len(REPORT['stages'])
+    names = [f'level{i}' for i in range(len(regions))]
+    root = f'D:/disaggregation-data/{data_name}/'
+
+    ## synthetic city & trips
+    with timer('generate city', timings):
+        levels = synthetic_city(regions, kind)
+        write_city(data_name, levels, names)
+    with timer('generate trips', timings):
+        longs, lats, timestamps = synthetic_trips(n_points, n_days=n_days)
+
+    ## geodata
+    boundary = get_boundary(root+'raw-data/zones.csv', {'zones': [1]})
+    geodatas = []
+    for name in names:
+        with timer(f'get_geodata {name}', timings):
+            geodatas.append(get_geodata(root+f'raw-data/{name}.csv', boundary, data_name, name))
+    with timer('get_extreme_data', timings):
+        get_extreme_data(geodatas[-2], data_name)
+
+    ## linkages
+    with timer('get_linkages', timings):
+        linkages = get_linkages(geodatas, names, data_name)
+
+    ## attributes
+    with timer('hour index', timings):
+        dates, times = hour_buckets(timestamps)
+        hour_index, UNIQUE_DATES, UNIQUE_TIME = get_hour_index(dates, times)
+        n_hours = len(UNIQUE_DATES)*len(UNIQUE_TIME)
+    with timer('attributes', timings):
+        attributes = get_attributes(geodatas, longs, lats, hour_index, n_hours)
+    with timer('attributes hierarchical', timings):
+        get_attributes(geodatas, longs, lats, hour_index, n_hours, [linkages[f'{name}_{names[-1]}'] for name in names[:-1]])
+    hours = (UNIQUE_DATES.astype('datetime64[h]')[:,None] + UNIQUE_TIME.astype('timedelta64[h]')[None,:]).ravel()
+    with timer('save attributes', timings):
+        save_attributes(data_name, names, attributes, hours)
+    with timer('load attributes', timings):
+        attributes = [attribute_rows(root, name, dtype='float64') for name in names]
+
+    ## images
+    for geodata, att, name in zip(geodatas, attributes, names):
+        with timer(f'label_map {name}', timings):
+            labels = label_map(geodata)
+        with timer(f'count_images {name}', timings):
+            write_count_images(root+f'img-data/{name}_imgs.zarr', att, labels)
+
+    ## splits
+    with timer('splits', timings):
+        save_splits(root+'splits.json', n_hours, [make_splits(n_hours, 24*n_days//5, 24*n_days//5)])
+        for name in names:
+            for split in ['train', 'val', 'test']:
+                np.asarray(load_split(root, name, split)).sum()
+
+    return {'kind': kind,
+            'regions': [len(geodata) for geodata in geodatas],
+            'points': int(n_points),
+            'hours': int(n_hours),
+            'timings': timings,
+            'peak_rss_mb': {stage['stage']: stage['peak_rss_mb'] for stage in REPORT['stages'][first_stage:] if stage['stage'] in timings}}
+
+def main():
+
+    #-------------------------
+    # arguments
+    #-------------------------
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--kinds', default='grid,voronoi', help='synthetic partitions. Values: grid/voronoi, comma separated')
+    parser.add_argument('--scales', default='small,medium', help='scales to run. Values: small/medium/large, comma separated')
+    parser.add_argument('--points', default=None, help='number of trips (overrides the scales), comma separated')
+    parser.add_argument('--n_days', default='30', help='number of days of trips')
+    parser.add_argument('--output', default='benchmark.json', help='json file the results are appended to')
+    args = parser.parse_args()
+
+    #-------------------------
+    # run
+    #-------------------------
+    start_report('D:/disaggregation-data/benchmark/', 'benchmark')
+    results = []
+    for kind in args.kinds.split(','):
+        for scale in args.scales.split(','):
+            points = [SCALES[scale]['points']] if args.points is None else [int(n) for n in args.points.split(',')]
+            for n_points in points:
+                print(f'Benchmark {kind} {scale}, {n_points} points...')
+                result = benchmark(kind, SCALES[scale]['regions'], n_points, int(args.n_days))
+                result['scale'] = scale
+                results.append(result)
+
+    #-------------------------
+    # save
+    #-------------------------
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    runs = []
+    if os.path.isfile(args.output):
+        with open(args.output) as f:
+            runs = json.load(f)
+    runs.append({'date': datetime.now().isoformat(timespec='seconds'),
+                 'commit': commit,
+                 'platform': platform.platform(),
+                 'cpus': os.cpu_count(),
+                 'results': results})
+    with open(args.output, 'w') as f:
+        json.dump(runs, f, indent=1)
+    save_report('done')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import numpy as np
+import shapely
+
+#----------------------
+# Grid Index
+#----------------------
+def build_grid_index(geometries,
+                     cells_per_region=256,
+                     max_cells=1<<24):
+
+    """
+
+    This function is used to build a grid index over the regions of one
+    resolution: a regular grid over their bounds (about `cells_per_region`
+    cells per region), where every cell stores
+
+        - the id of its owner (>= 0), if one region contains the whole
+          cell in its interior: every point of the cell is in that region only
+        - -1, if no region intersects the cell
+        - -2-k otherwise (boundary cell k), with the candidate regions of
+          the cell in candidates[ptr[k]:ptr[k+1]] for the exact test
+
+    Returns a dict of arrays: bounds, cells (ny x nx), ptr, candidates.
+
+    """
+
+    geometries = np.asarray(geometries)
+    if len(geometries) == 0:
+        return {'bounds': np.full(4, np.nan),
+                'cells': np.full((1,1), -1, dtype='int32'),
+                'ptr': np.zeros(1, dtype='int64'),
+                'candidates': np.zeros(0, dtype='int32')}
+    shapely.prepare(geometries)
+    minx, miny, maxx, maxy = shapely.total_bounds(geometries)
+    width, height = max(maxx-minx, 1e-9), max(maxy-miny, 1e-9)
+    size = np.sqrt(width*height/min(max_cells, cells_per_region*max(len(geometries), 1)))
+    nx, ny = max(1, int(np.ceil(width/size))), max(1, int(np.ceil(height/size)))
+    dx, dy = width/nx, height/ny
+
+    ## cell boxes (row major), slightly enlarged against rounding
+    xs = minx + dx*np.arange(nx)
+    ys = miny + dy*np.arange(ny)
+    eps = 1e-6*max(dx, dy)
+    boxes = shapely.box(xs[None,:]-eps, ys[:,None]-eps, xs[None,:]+dx+eps, ys[:,None]+dy+eps).ravel()
+
+    ## owners: the only region intersecting the cell, containing it
+    cell_index, region_index = shapely.STRtree(geometries).query(boxes, predicate='intersects')
+    n_hits = np.bincount(cell_index, minlength=len(boxes))
+    single = np.where(n_hits[cell_index] == 1)[0]
+    interior = single[shapely.contains_properly(geometries[region_index[single]], boxes[cell_index[single]])]
+    cells = np.full(len(boxes), -1, dtype='int32')
+    cells[cell_index[interior]] = region_index[interior]
+
+    ## boundary cells: sorted candidate lists
+    boundary = np.where((n_hits > 0) & (cells == -1))[0]
+    cells[boundary] = -2 - np.arange(len(boundary))
+    keep = cells[cell_index] <= -2
+    order = np.lexsort((region_index[keep], cell_index[keep]))
+    candidates = region_index[keep][order].astype('int32')
+    ptr = np.concatenate([[0], np.cumsum(n_hits[boundary])]).astype('int64')
+
+    return {'bounds': np.array([minx, miny, minx+width, miny+height]),
+            'cells': cells.reshape(ny, nx),
+            'ptr': ptr,
+            'candidates': candidates}
+
+def save_grid_index(path,
+                    grid):
+    np.savez_compressed(path, **grid)
+
+def load_grid_index(path):
+    arrays = np.load(path)
+    return {name: arrays[name] for name in arrays.files}
+
+def grid_pairs(grid,
+               geometries,
+               longs,
+               lats):
+
+    """
+
+    This function is used to find the regions of every point with a grid
+    index: points of owned cells get their owner (a lookup), points of
+    boundary cells are tested exactly against the candidates of their cell.
+
+    Returns (point_index, region_index) pairs, same pairs as an STRtree
+    query with predicate 'intersects' (a point on a shared border gets one
+    pair per region).
+
+    """
+
+    longs = np.asarray(longs, dtype='float')
+    lats = np.asarray(lats, dtype='float')
+    minx, miny, maxx, maxy = grid['bounds']
+    ny, nx = grid['cells'].shape
+
+    ## cell of every point in the grid (NaN & outside points are dropped)
+    point = np.where((longs >= minx) & (longs <= maxx) & (lats >= miny) & (lats <= maxy))[0]
+    ix = np.minimum(((longs[point]-minx)*(nx/(maxx-minx))).astype('int64'), nx-1)
+    iy = np.minimum(((lats[point]-miny)*(ny/(maxy-miny))).astype('int64'), ny-1)
+    cell = grid['cells'][iy, ix]
+
+    ## owned cells
+    owned = cell >= 0
+    point_index = [point[owned]]
+    region_index = [cell[owned]]
+
+    ## boundary cells: every (point, candidate) pair, tested exactly
+    boundary = cell <= -2
+    k = -2 - cell[boundary]
+    starts = grid['ptr'][k]
+    counts = grid['ptr'][k+1] - starts
+    offsets = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+    candidate = grid['candidates'][np.arange(offsets.size) + offsets]
+    pair_point = np.repeat(point[boundary], counts)
+    hit = shapely.intersects_xy(geometries[candidate], longs[pair_point], lats[pair_point])
+    point_index.append(pair_point[hit])
+    region_index.append(candidate[hit])
+
+    return np.concatenate(point_index).astype('int64'), np.concatenate(region_index).astype('int64')
+
+def first_regions(point_index,
+                  region_index,
+                  n_points):
+
+    """
+    This function is used to get the lowest region id of every point from (point, region) pairs (-1 if none).
+    """
+
+    regions = np.full(n_points, np.iinfo('int32').max, dtype='int32')
+    np.minimum.at(regions, point_index, region_index.astype('int32'))
+    regions[regions == np.iinfo('int32').max] = -1
+    return regions
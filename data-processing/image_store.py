@@ -0,0 +1,105 @@
+import zarr
+import numpy as np
+from numcodecs import Blosc
+from rasterize import label_map, label_boundaries, count_images
+from instrument import timer
+
+#----------------------
+# Image Store Function
+#----------------------
+def create_image_store(path,
+                       n_hours,
+                       img_shape,
+                       dtype='float32',
+                       chunk_hours=24,
+                       clevel=5):
+
+    """
+
+    This function is used to create an on-disk image store (zarr array) of
+    shape (n_hours, height, width), chunked along time (`chunk_hours` hours
+    per chunk) and compressed with blosc/zstd.
+
+    Arg:
+        - path: store folder, e.g. img-data/{name}_imgs.zarr
+        - dtype: float32 (default), float16 or float64
+
+    """
+
+    compressor = Blosc(cname='zstd', clevel=clevel, shuffle=Blosc.BITSHUFFLE)
+    return zarr.open_array(path,
+                           mode='w',
+                           shape=(n_hours,)+tuple(img_shape),
+                           chunks=(chunk_hours,)+tuple(img_shape),
+                           dtype=dtype,
+                           compressor=compressor,
+                           fill_value=0)
+
+def write_count_images(path,
+                       att,
+                       labels,
+                       dtype='float32',
+                       chunk_hours=24):
+
+    """
+
+    This function is used to write the count images of every hour of `att`
+    (see `count_images`) into an image store, one chunk of hours at a time,
+    so only one chunk of images is in memory.
+
+    """
+
+    store = create_image_store(path, len(att), labels.shape, dtype, chunk_hours)
+    for start in range(0, len(att), chunk_hours):
+        store[start:start+chunk_hours] = count_images(att[start:start+chunk_hours], labels)
+    return store
+
+def open_image_store(path):
+
+    """
+
+    This function is used to open an image store read-only. Nothing is read
+    until sliced: store[start:stop] only decompresses the chunks of these
+    hours.
+
+    """
+
+    return zarr.open_array(path, mode='r')
+
+#----------------------
+# Save Images Function
+#----------------------
+def save_images(root,
+                name,
+                geodata,
+                att,
+                img_size=(128,256),
+                img_dtype='float32',
+                npy=False):
+
+    """
+
+    This function is used to generate the images of one resolution: the
+    label map & boundaries ({name}_labels.npy, {name}_boundaries.npy) and
+    the count images ({name}_imgs.zarr, and {name}_imgs_all.npy if `npy`).
+
+    Arg:
+        - root: dataset folder, e.g. D:/disaggregation-data/taxi/
+        - geodata, att: regions & hourly attributes of the resolution
+
+    """
+
+    ## label map & boundaries
+    with timer(f'{name}: label map', rows=len(geodata)):
+        labels = label_map(geodata, img_size)
+        boundaries = label_boundaries(labels, len(geodata))
+
+    ## chunked & compressed image store, written one day at a time
+    with timer(f'{name}: count images', rows=len(att)):
+        write_count_images(root+f'img-data/{name}_imgs.zarr', att, labels, img_dtype)
+        if npy:
+            np.save(root+f'img-data/{name}_imgs_all.npy', count_images(att, labels))
+
+    ## save label map & boundaries
+    np.save(root+f'img-data/{name}_labels.npy', labels)
+    np.save(root+f'img-data/{name}_boundaries.npy', boundaries)
@@ -0,0 +1,425 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import shapely
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from instrument import accumulate, timed, bind_counters
+
+#----------------------
+# Source Columns
+#----------------------
+def read_header(path):
+
+    """
+    This function is used to read the column names of a raw csv file.
+    """
+
+    reader = pv.open_csv(path, read_options=pv.ReadOptions(block_size=1<<16))
+    return reader.schema.names
+
+def source_columns(data_name,
+                   parameters,
+                   path):
+
+    """
+
+    This function is used to map the raw column names of one file to the
+    unified event columns (time, lat, long, ...).
+
+    """
+
+    if data_name == 'taxi':
+        time, long, lat = parameters['column_names'][parameters['year']]
+        return {time: 'time', long: 'long', lat: 'lat'}
+    elif data_name == 'bikeshare':
+        variables = [
+            {'starttime': 'time', 'start station latitude': 'lat', 'start station longitude': 'long'},
+            {'started_at': 'time', 'start_lat': 'lat', 'start_lng': 'long'}
+        ]
+        header = read_header(path)
+        if all(name in header for name in variables[0]): return variables[0]
+        else: return variables[1]
+    elif data_name == '911':
+        return {'CREATE_DATE': 'date', 'INCIDENT_TIME': 'time',
+                'Latitude': 'lat', 'Longitude': 'long', 'BORO_NM': 'borough'}
+    else:
+        return {'Trip Start Timestamp': 'time',
+                'Pickup Centroid Latitude': 'lat',
+                'Pickup Centroid Longitude': 'long'}
+
+def source_files(parameters):
+
+    """
+
+    This function is used to list the raw files of a dataset: every file of
+    the year folder (taxi, bikeshare) or the single raw csv (911, chicago).
+
+    """
+
+    root = parameters['root']
+    if os.path.isfile(root): return [root]
+    dirt = root + str(parameters['year']) + '/'
+    return [dirt + file for file in sorted(os.listdir(dirt))]
+
+def source_years(parameters):
+
+    """
+
+    This function is used to list the raw files of every year to count,
+    parameters['years'] (default: parameters['year']), each with the
+    parameters of its year, since the raw columns & timestamp formats
+    depend on it. A single raw csv (911, chicago) covers every year.
+
+    Returns [(year parameters, raw file)], year by year.
+
+    """
+
+    if os.path.isfile(parameters['root']): return [(parameters, parameters['root'])]
+    files = []
+    for year in parameters.get('years') or [parameters['year']]:
+        year_parameters = dict(parameters, year=str(year))
+        files += [(year_parameters, path) for path in source_files(year_parameters)]
+    return files
+
+#----------------------
+# Stream Events
+#----------------------
+def read_events(path,
+                columns,
+                formats,
+                bbox=None,
+                boundary=None,
+                borough=None,
+                block_size=1<<26):
+
+    """
+
+    This function is used to stream one raw csv file as event chunks.
+
+    Only the needed columns are parsed (pyarrow), with float64 coordinates
+    and string timestamps, in blocks of `block_size` bytes. Rows are filtered
+    chunk by chunk, so memory stays bounded by the block size.
+
+    Arg:
+        - columns: {raw column name: unified name}, see `source_columns`
+        - formats: timestamp formats, see `date_formats`
+        - bbox: (lat_bottom, lat_upper, long_left, long_right)
+        - boundary: optional polygon, events outside are dropped
+        - borough: optional value of the 'borough' column to keep
+
+    Yields dicts with 'timestamp' (datetime64[s]), 'lat' & 'long' (float
+    arrays). Rows with missing values or unparsable timestamps are dropped.
+
+    """
+
+    column_types = {raw: pa.float64() if name in ['lat', 'long'] else pa.string()
+                    for raw, name in columns.items()}
+    with accumulate('read csv'):
+        reader = pv.open_csv(path,
+                             read_options=pv.ReadOptions(block_size=block_size),
+                             convert_options=pv.ConvertOptions(include_columns=list(columns),
+                                                               column_types=column_types,
+                                                               strings_can_be_null=True))
+    for batch in timed(reader, 'read csv', lambda batch: batch.num_rows):
+        chunk = {columns[raw]: batch.column(raw) for raw in batch.schema.names}
+        lat = chunk['lat'].to_numpy(zero_copy_only=False)
+        long = chunk['long'].to_numpy(zero_copy_only=False)
+
+        ## filters (missing values are dropped)
+        mask = ~(np.isnan(lat) | np.isnan(long))
+        for name, values in chunk.items():
+            if name not in ['lat', 'long']:
+                mask &= ~values.is_null().to_numpy(zero_copy_only=False)
+        if borough is not None:
+            mask &= pc.fill_null(pc.equal(chunk['borough'], borough), False).to_numpy(zero_copy_only=False)
+        if bbox is not None:
+            lat_bottom, lat_upper, long_left, long_right = bbox
+            mask &= (lat <= lat_upper) & (lat >= lat_bottom) & (long <= long_right) & (long >= long_left)
+        if boundary is not None:
+            mask[mask] = shapely.contains_xy(boundary, long[mask], lat[mask])
+        if not mask.any():
+            continue
+
+        ## 911 date & time columns -> one timestamp
+        keep = pa.array(mask)
+        if 'date' in chunk: time = pc.binary_join_element_wise(chunk['date'], chunk['time'], ' ')
+        else: time = chunk['time']
+        with accumulate('parse timestamps', int(mask.sum())):
+            timestamps = parse_timestamps(time.filter(keep), formats)
+        parsed = ~np.isnat(timestamps)
+        if not parsed.any():
+            continue
+        yield {'timestamp': timestamps[parsed], 
+               'lat': lat[mask][parsed], 
+               'long': long[mask][parsed]}
+
+#----------------------
+# Date & Time
+#----------------------
+def date_formats(parameters,
+                 data_name):
+
+    """
+
+    This function is used to get the declared timestamp format(s) of a
+    source & year from parameters['date_formats'] (strptime syntax). A
+    source may declare a 'default' format for all years.
+
+    """
+
+    formats = parameters['date_formats'][data_name]
+    formats = formats.get(str(parameters['year']), formats.get('default'))
+    if isinstance(formats, str): formats = [formats]
+    return formats
+
+def parse_timestamps(records,
+                     formats):
+
+    """
+
+    This function is used to parse timestamp strings (pyarrow array) into
+    datetime64[s], vectorized. Formats are tried in order for the records
+    the previous ones could not parse; 12AM/12PM are handled by %I/%p.
+    Fractional seconds are dropped; unparsable records give NaT.
+
+    """
+
+    records = pc.replace_substring_regex(records, pattern=r'(:\d{2})\.\d+', replacement=r'\1')
+    timestamps = None
+    for fmt in formats:
+        parsed = pc.strptime(records, format=fmt, unit='s', error_is_null=True)
+        if timestamps is None: timestamps = parsed
+        else: timestamps = pc.coalesce(timestamps, parsed)
+    return timestamps.to_numpy(zero_copy_only=False).astype('datetime64[s]')
+
+def hour_buckets(timestamps):
+
+    """
+
+    This function is used to split timestamps into hour buckets: the date
+    (datetime64[D]) and the hour of the day (0-23).
+
+    """
+
+    hours = timestamps.astype('datetime64[h]')
+    dates = hours.astype('datetime64[D]')
+    times = (hours - dates).astype('int64')
+    return dates, times
+
+#----------------------
+# Event Cache
+#----------------------
+EVENT_CACHE_VERSION = 2
+EVENT_SCHEMA = pa.schema([('timestamp', pa.timestamp('s')),
+                          ('lat', pa.float64()),
+                          ('long', pa.float64()),
+                          ('source', pa.string()),
+                          ('date', pa.string())])
+
+def event_cache_dir(cache_root, 
+                    path):
+    
+    """
+    This function is used to get the cache folder of one raw file.
+    """
+    
+    name = os.path.splitext(os.path.basename(path))[0]
+    digest = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:10]
+    return os.path.join(cache_root, f'{name}-{digest}')
+
+def event_cache_meta(path,
+                     columns,
+                     formats,
+                     bbox,
+                     borough):
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'columns': columns,
+            'formats': list(formats),
+            'bbox': list(bbox) if bbox is not None else None,
+            'borough': borough,
+            'version': EVENT_CACHE_VERSION}
+
+def write_event_cache(path,
+                      columns,
+                      formats,
+                      cache_dir,
+                      bbox=None,
+                      borough=None):
+    
+    """
+    
+    This function is used to write the cleaned events of one raw file as a
+    Parquet dataset partitioned by date (hive style, date=YYYY-MM-DD). 
+    Columns are (timestamp, lat, long, source); source is the raw file name.
+    
+    """
+    
+    if os.path.isdir(cache_dir): shutil.rmtree(cache_dir)
+    os.makedirs(cache_dir)
+    source = os.path.basename(path)
+    
+    def batches():
+        for events in read_events(path, columns, formats, bbox=bbox, borough=borough):
+            n = len(events['timestamp'])
+            dates = events['timestamp'].astype('datetime64[D]').astype('str')
+            yield pa.record_batch([pa.array(events['timestamp']), 
+                                   pa.array(events['lat']), 
+                                   pa.array(events['long']),
+                                   pa.repeat(pa.scalar(source), n),
+                                   pa.array(dates)], 
+                                  schema=EVENT_SCHEMA)
+    
+    ds.write_dataset(bind_counters(batches()),
+                     cache_dir,
+                     schema=EVENT_SCHEMA,
+                     format='parquet',
+                     partitioning=ds.partitioning(pa.schema([('date', pa.string())]), flavor='hive'),
+                     existing_data_behavior='overwrite_or_ignore',
+                     basename_template='part-{i}.parquet',
+                     max_partitions=1<<16)
+    
+    ## meta last: an interrupted write stays stale
+    with open(os.path.join(cache_dir, '_meta.json'), 'w') as f:
+        json.dump(event_cache_meta(path, columns, formats, bbox, borough), f)
+
+def read_event_cache(cache_dir,
+                     boundary=None,
+                     batch_size=1<<20):
+    
+    """
+    This function is used to stream the cached events of one raw file (none if all its events were filtered out).
+    """
+    
+    ## with the schema: a file without events has an empty dataset
+    dataset = ds.dataset(cache_dir, 
+                         schema=EVENT_SCHEMA,
+                         format='parquet', 
+                         partitioning=ds.partitioning(pa.schema([('date', pa.string())]), flavor='hive'))
+    for batch in timed(dataset.to_batches(columns=['timestamp', 'lat', 'long'], batch_size=batch_size), 'read event cache', lambda batch: batch.num_rows):
+        if batch.num_rows == 0:
+            continue
+        events = {'timestamp': batch.column('timestamp').to_numpy(zero_copy_only=False),
+                  'lat': batch.column('lat').to_numpy(zero_copy_only=False),
+                  'long': batch.column('long').to_numpy(zero_copy_only=False)}
+        if boundary is not None:
+            mask = shapely.contains_xy(boundary, events['long'], events['lat'])
+            if not mask.any(): continue
+            events = {name: values[mask] for name, values in events.items()}
+        yield events
+
+def load_events(path,
+                columns,
+                formats,
+                bbox=None,
+                boundary=None,
+                borough=None,
+                cache_root=None):
+    
+    """
+    
+    This function is used to stream the events of one raw file, through the
+    Parquet event cache if `cache_root` is given. The cache entry is
+    (re)built when missing or stale, i.e. when the raw file's size or mtime,
+    the columns, the timestamp formats or the filters changed.
+    
+    """
+    
+    if cache_root is None:
+        yield from read_events(path, columns, formats, bbox=bbox, boundary=boundary, borough=borough)
+        return
+    
+    cache_dir = event_cache_dir(cache_root, path)
+    meta_path = os.path.join(cache_dir, '_meta.json')
+    meta = None
+    if os.path.isfile(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+    if meta != event_cache_meta(path, columns, formats, bbox, borough):
+        write_event_cache(path, columns, formats, cache_dir, bbox, borough)
+    yield from read_event_cache(cache_dir, boundary)
+
+#----------------------
+# Event Partitions
+#----------------------
+PARTITION_SCHEMA = pa.schema([('timestamp', pa.timestamp('s')),
+                              ('lat', pa.float64()),
+                              ('long', pa.float64()),
+                              ('tile', pa.int32()),
+                              ('month', pa.string())])
+
+def write_partitions(events,
+                     partition_root,
+                     source):
+    
+    """
+    
+    This function is used to write events (dicts with 'timestamp', 'lat',
+    'long' & 'tile') into a Parquet dataset partitioned by spatial tile &
+    month (hive style, tile=3/month=2016-01). Files are named after
+    `source`, so several raw files can be written into the same dataset at
+    the same time.
+    
+    """
+    
+    os.makedirs(partition_root, exist_ok=True)
+    
+    def batches():
+        for chunk in events:
+            months = chunk['timestamp'].astype('datetime64[M]').astype('str')
+            yield pa.record_batch([pa.array(chunk['timestamp']), 
+                                   pa.array(chunk['lat']), 
+                                   pa.array(chunk['long']),
+                                   pa.array(chunk['tile'], type=pa.int32()),
+                                   pa.array(months)], 
+                                  schema=PARTITION_SCHEMA)
+    
+    ds.write_dataset(bind_counters(batches()),
+                     partition_root,
+                     schema=PARTITION_SCHEMA,
+                     format='parquet',
+                     partitioning=ds.partitioning(pa.schema([('tile', pa.int32()), ('month', pa.string())]), flavor='hive'),
+                     existing_data_behavior='overwrite_or_ignore',
+                     basename_template=source+'-{i}.parquet',
+                     max_partitions=1<<16)
+
+def list_partitions(partition_root):
+    
+    """
+    
+    This function is used to list the partitions of an event partition
+    dataset as (month, tile, folder), sorted by month then tile.
+    
+    """
+    
+    partitions = []
+    for tile_dir in os.listdir(partition_root):
+        if not tile_dir.startswith('tile='): continue
+        for month_dir in os.listdir(os.path.join(partition_root, tile_dir)):
+            if not month_dir.startswith('month='): continue
+            partitions.append((month_dir[len('month='):], 
+                               int(tile_dir[len('tile='):]), 
+                               os.path.join(partition_root, tile_dir, month_dir)))
+    return sorted(partitions)
+
+def read_partition(path,
+                   batch_size=1<<20):
+    
+    """
+    This function is used to stream the events of one partition folder.
+    """
+    
+    dataset = ds.dataset(path, format='parquet')
+    for batch in timed(dataset.to_batches(columns=['timestamp', 'lat', 'long'], batch_size=batch_size), 'read partition', lambda batch: batch.num_rows):
+        if batch.num_rows == 0:
+            continue
+        yield {'timestamp': batch.column('timestamp').to_numpy(zero_copy_only=False),
+               'lat': batch.column('lat').to_numpy(zero_copy_only=False),
+               'long': batch.column('long').to_numpy(zero_copy_only=False)}
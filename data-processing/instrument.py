@@ -0,0 +1,356 @@
+import os
+import re
+import sys
+import json
+import time
+import fnmatch
+import cProfile
+import platform
+import threading
+import contextlib
+from datetime import datetime
+import psutil
+
+#----------------------
+# Memory
+#----------------------
+## during a run report (see `start_report`), resident memory is sampled
+## by one thread, every SAMPLE_INTERVAL seconds, into the peak of every
+## running stage; the same thread saves the report every REPORT_INTERVAL
+## seconds. Without report (e.g. library use, worker processes), stages
+## only take the memory at their start & end
+SAMPLE_INTERVAL = 0.1
+REPORT_INTERVAL = 2.0
+SAMPLER = {'pid': None, 'running': {}, 'peak': 0}
+LOCK = threading.Lock()
+
+def memory_usage():
+
+    """
+    This function is used to get the resident memory (bytes) of this process & its worker processes.
+    """
+
+    process = psutil.Process()
+    rss = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try: rss += child.memory_info().rss
+        except psutil.Error: pass
+    return rss
+
+def record_memory(rss):
+    with LOCK:
+        SAMPLER['peak'] = max(SAMPLER['peak'], rss)
+        for record in SAMPLER['running'].values():
+            record['peak_rss'] = max(record['peak_rss'], rss)
+
+def sample_memory():
+    saved = time.perf_counter()
+    while True:
+        record_memory(memory_usage())
+        if time.perf_counter()-saved >= REPORT_INTERVAL:
+            save_report()
+            saved = time.perf_counter()
+        time.sleep(SAMPLE_INTERVAL)
+
+def sampling():
+
+    ## (a forked worker process has no sampler thread)
+    return SAMPLER['pid'] == os.getpid()
+
+def start_sampler():
+    with LOCK:
+        if sampling(): return
+        SAMPLER['pid'] = os.getpid()
+        SAMPLER['running'] = {}
+    threading.Thread(target=sample_memory, daemon=True).start()
+
+#----------------------
+# Sub-stage Counters
+#----------------------
+## counters of the stages running in this thread (see `accumulate`)
+LOCAL = threading.local()
+
+def counter_stack():
+    if not hasattr(LOCAL, 'stack'): LOCAL.stack = []
+    return LOCAL.stack
+
+@contextlib.contextmanager
+def counters(detach=False):
+
+    """
+
+    This function is used to collect the sub-stage counters (see
+    `accumulate`) of a block of code into a dict {sub-stage: {seconds,
+    rows, calls}}. With `detach`, the running stages do not get them, e.g.
+    in a worker function whose counters are returned to the parent process
+    (see `merge_counters`), which may be this process when the map runs in
+    process.
+
+    """
+
+    collected = {}
+    stack = counter_stack()
+    if detach: LOCAL.stack = [collected]
+    else: stack.append(collected)
+    try:
+        yield collected
+    finally:
+        if detach: LOCAL.stack = stack
+        else: stack.pop()
+
+def merge_counters(collected):
+
+    """
+    This function is used to add sub-stage counters (e.g. of a worker process) to the running stages.
+    """
+
+    for running in counter_stack():
+        for stage, counter in collected.items():
+            total = running.setdefault(stage, {'seconds': 0.0, 'rows': 0, 'calls': 0})
+            for key in total: total[key] += counter[key]
+
+@contextlib.contextmanager
+def accumulate(stage, rows=0):
+
+    """
+
+    This function is used to add the wall time & rows of a step run many
+    times, e.g. once per event chunk, to the counters of the running stages
+    (see `timer`), without printing. Rows can also be set in the block:
+
+        with accumulate('join') as step:
+            ...
+            step['rows'] = n
+
+    """
+
+    step = {'rows': rows}
+    start = time.perf_counter()
+    yield step
+    if counter_stack():
+        merge_counters({stage: {'seconds': time.perf_counter()-start, 'rows': step['rows'], 'calls': 1}})
+
+def timed(iterable, stage, rows=len):
+
+    """
+    This function is used to iterate with the time spent producing every item (e.g. reading a chunk) added to `stage` (see `accumulate`).
+    """
+
+    iterator = iter(iterable)
+    while True:
+        with accumulate(stage) as step:
+            item = next(iterator, StopIteration)
+            if item is not StopIteration: step['rows'] = rows(item)
+        if item is StopIteration: return
+        yield item
+
+def bind_counters(iterable):
+
+    """
+
+    This function is used to iterate with the counters of this thread,
+    whichever thread runs the iteration, e.g. a generator consumed by the
+    threads of pyarrow's `write_dataset`.
+
+    """
+
+    ## (the stack is taken here, not when the iteration starts)
+    stack = counter_stack()
+    def iterate():
+        iterator = iter(iterable)
+        while True:
+            previous = counter_stack()
+            LOCAL.stack = stack
+            try:
+                item = next(iterator, StopIteration)
+            finally:
+                LOCAL.stack = previous
+            if item is StopIteration: return
+            yield item
+    return iterate()
+
+#----------------------
+# Stages
+#----------------------
+## run report of this process (see `start_report`)
+WRITE_LOCK = threading.Lock()
+REPORT = {'path': None, 'pid': None, 'script': None, 'started': None, 'start': None,
+          'profile': None, 'profiled': False, 'status': None, 'stages': []}
+
+def megabytes(n_bytes):
+    return round(n_bytes/2**20, 1)
+
+def throughput(rows, seconds):
+    if not rows or seconds <= 0: return None
+    return round(rows/seconds, 1)
+
+@contextlib.contextmanager
+def timer(stage, timings=None, rows=None):
+
+    """
+
+    This function is used to instrument a processing stage: wall time, rows
+    (events, regions, hours...) per second, peak resident memory (of this
+    process & its workers, see `memory_usage`; sampled during a run report
+    only, else the larger of the start & end memory) and the sub-stages run
+    in it (see `accumulate`). The stage is printed, recorded in `timings[stage]`
+    (seconds) if given and in the run report (see `start_report`).
+
+    Rows can be given, or set in the block:
+
+        with timer('count raw files') as record:
+            ...
+            record['rows'] = n_events
+
+    Stages can be nested; stages running in parallel threads (see
+    `run_pipeline`) share the memory of the process.
+
+    """
+
+    rss = memory_usage()
+    record = {'stage': stage, 'depth': len(counter_stack()), 'rows': rows, 'rss': rss, 'peak_rss': rss,
+              'started': datetime.now().isoformat(timespec='seconds'), 'start': time.perf_counter()}
+    with LOCK:
+        sampled = sampling()
+        if sampled: SAMPLER['running'][id(record)] = record
+
+    profiler = start_profile(stage)
+    status = 'failed'
+    try:
+        with counters() as collected:
+            yield record
+        status = 'done'
+    finally:
+        elapsed = time.perf_counter()-record['start']
+        profile = stop_profile(profiler, stage)
+        rss = memory_usage()
+        record['peak_rss'] = max(record['peak_rss'], rss)
+        if sampled:
+            record_memory(rss)
+            with LOCK:
+                SAMPLER['running'].pop(id(record))
+
+        rows = record['rows']
+        summary = {'stage': stage,
+                   'depth': record['depth'],
+                   'status': status,
+                   'started': record['started'],
+                   'seconds': round(elapsed, 4),
+                   'rows': rows,
+                   'rows_per_s': throughput(rows, elapsed),
+                   'rss_start_mb': megabytes(record['rss']),
+                   'peak_rss_mb': megabytes(record['peak_rss']),
+                   'substages': {name: dict(counter, seconds=round(counter['seconds'], 4), rows_per_s=throughput(counter['rows'], counter['seconds']))
+                                 for name, counter in collected.items()}}
+        if profile is not None: summary['profile'] = profile
+        with LOCK:
+            REPORT['stages'].append(summary)
+        if status == 'failed': save_report()
+
+        if timings is not None: timings[stage] = elapsed
+        message = f"   -- {stage}: {elapsed:.2f}s"
+        if summary['rows_per_s'] is not None: message += f", {summary['rows_per_s']:,.0f} rows/s"
+        print(message + f", peak {summary['peak_rss_mb']:,.0f} MB")
+
+#----------------------
+# Profile
+#----------------------
+def start_profile(stage):
+    with LOCK:
+        if REPORT['profile'] is None or REPORT['profiled'] or not fnmatch.fnmatch(stage, REPORT['profile']): return None
+        REPORT['profiled'] = True
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+def stop_profile(profiler,
+                 stage):
+
+    """
+    This function is used to save the cProfile stats of a stage next to the run report (see `start_report`).
+    """
+
+    if profiler is None: return None
+    profiler.disable()
+    path = REPORT['path'][:-len('.json')] + '-' + re.sub(r'[^\w.-]+', '_', stage) + '.prof'
+    profiler.dump_stats(path)
+    print(f"   -- {stage}: profile saved in {path}")
+    return path
+
+#----------------------
+# Run Report
+#----------------------
+def start_report(root,
+                 script,
+                 profile=None):
+
+    """
+
+    This function is used to start the run report of a script, saved in
+    {root}reports/{script}-{YYYYmmdd-HHMMSS}.json (e.g. root
+    D:/disaggregation-data/taxi/): the machine, the arguments and every
+    stage (see `timer`). The report is saved every REPORT_INTERVAL seconds
+    during the run, so a run that is killed, e.g. out of memory, still
+    reports the stages it was in & their memory.
+
+    Arg:
+        - profile: stage name pattern (e.g. 'extreme: *'); the first
+                   matching stage run in this process is profiled with
+                   cProfile into {report}-{stage}.prof (see `pstats` or
+                   `snakeviz` to read it); worker processes are not
+                   profiled, so profile counting stages with one worker
+
+    """
+
+    os.makedirs(root+'reports', exist_ok=True)
+    started = datetime.now()
+    with LOCK:
+        REPORT.update(path=root+f"reports/{script}-{started.strftime('%Y%m%d-%H%M%S')}.json",
+                      pid=os.getpid(),
+                      script=script,
+                      started=started.isoformat(timespec='seconds'),
+                      start=time.perf_counter(),
+                      profile=profile,
+                      profiled=False,
+                      status='running',
+                      stages=[])
+    start_sampler()
+    save_report()
+    return REPORT['path']
+
+def save_report(status=None):
+
+    """
+
+    This function is used to save the run report (see `start_report`), with
+    the stages done and the ones running. Nothing is saved if no report
+    was started in this process (e.g. in a worker process).
+
+    """
+
+    with WRITE_LOCK:
+        with LOCK:
+            if REPORT['path'] is None or REPORT['pid'] != os.getpid(): return
+            if status is not None: REPORT['status'] = status
+            now = time.perf_counter()
+            report = {'script': REPORT['script'],
+                      'argv': sys.argv[1:],
+                      'status': REPORT['status'],
+                      'started': REPORT['started'],
+                      'seconds': round(now-REPORT['start'], 4),
+                      'peak_rss_mb': megabytes(SAMPLER['peak']),
+                      'platform': platform.platform(),
+                      'python': platform.python_version(),
+                      'cpus': os.cpu_count(),
+                      'memory_mb': megabytes(psutil.virtual_memory().total),
+                      'stages': list(REPORT['stages']),
+                      'running': [{'stage': record['stage'],
+                                   'started': record['started'],
+                                   'seconds': round(now-record['start'], 4),
+                                   'peak_rss_mb': megabytes(record['peak_rss'])} for record in SAMPLER['running'].values()]}
+
+        ## atomic: a killed run leaves the last complete report
+        tmp = REPORT['path'] + f'.tmp-{os.getpid()}'
+        with open(tmp, 'w') as f:
+            json.dump(report, f, indent=1)
+        os.replace(tmp, REPORT['path'])
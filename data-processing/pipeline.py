@@ -0,0 +1,299 @@
+import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from utils import *
+
+#----------------------
+# Datasets
+#----------------------
+## parameter file, raw data & last date of every dataset (as in step1)
+DATASETS = {
+    'taxi': {'parameters': 'parameters.json',
+             'root': 'D:/all-data/nyc-taxi/raw_chunk_data/',
+             'year': '2016',
+             'max_date': None},
+    'bikeshare': {'parameters': 'parameters.json',
+                  'root': 'D:/all-data/nyc-bikeshare/raw_data/',
+                  'year': '2021',
+                  'max_date': '2021-06-30'},
+    '911': {'parameters': 'parameters.json',
+            'root': 'D:/all-data/nyc-911/911.csv',
+            'year': '2021',
+            'max_date': '2022-06-30'},
+    'chicago': {'parameters': 'chicago-parameters.json',
+                'root': None,
+                'year': None,
+                'max_date': None},
+}
+
+def load_parameters(data_name):
+
+    """
+    This function is used to load the city configuration of a dataset.
+    """
+
+    dataset = DATASETS[data_name]
+    with open(dataset['parameters']) as json_file:
+        parameters = json.load(json_file)
+    if dataset['root'] is not None: parameters['root'] = dataset['root']
+    if dataset['year'] is not None: parameters['year'] = dataset['year']
+    return parameters
+
+#----------------------
+# Stage
+#----------------------
+class Stage():
+
+    """
+    One step of the pipeline
+    """
+
+    def __init__(self,
+                 name,
+                 deps,
+                 inputs,
+                 outputs,
+                 run,
+                 load=None):
+
+        ## run(get) computes the stage, get(name) gives the value of a dependency;
+        ## load() gives the value of a skipped stage from its outputs;
+        ## a stage without outputs is only computed when a dependant needs it
+        self.name = name
+        self.deps = deps
+        self.inputs = inputs
+        self.outputs = outputs
+        self.run = run
+        self.load = load
+
+def stamp(path):
+
+    """
+    This function is used to describe a file by its size & mtime (None if missing).
+    """
+
+    if not os.path.exists(path): return None
+    stat = os.stat(path)
+    return [path, stat.st_size, stat.st_mtime]
+
+def stage_fingerprints(stages):
+
+    """
+
+    This function is used to fingerprint every stage: the hash of its own
+    inputs and of the fingerprints of its dependencies, so a change
+    invalidates every stage downstream.
+
+    """
+
+    fingerprints = {}
+    for stage in stages:
+        parts = [stage.inputs, [fingerprints[dep] for dep in stage.deps]]
+        fingerprints[stage.name] = hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()
+    return fingerprints
+
+def run_pipeline(stages,
+                 state_path,
+                 threads=4,
+                 force=False):
+
+    """
+
+    This function is used to run the stages (in dependency order) with a
+    pool of `threads` threads: a stage starts as soon as its dependencies
+    are done, so independent stages run in parallel.
+
+    A stage is skipped when its fingerprint is the one recorded in
+    `state_path` by its last run and its outputs exist (unless `force`).
+
+    """
+
+    stages = {stage.name: stage for stage in stages}
+    fingerprints = stage_fingerprints(stages.values())
+    state = {}
+    if os.path.isfile(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+
+    values = {}
+    locks = {name: threading.Lock() for name in stages}
+    state_lock = threading.Lock()
+
+    def get(name):
+        with locks[name]:
+            if name not in values:
+                stage = stages[name]
+                values[name] = stage.run(get) if not stage.outputs else stage.load()
+        return values[name]
+
+    def execute(stage):
+        fresh = state.get(stage.name) == fingerprints[stage.name] and all(os.path.exists(path) for path in stage.outputs)
+        if fresh and not force:
+            print(f"   -- {stage.name}: up to date")
+            return
+        with locks[stage.name]:
+            with timer(stage.name):
+                values[stage.name] = stage.run(get)
+        with state_lock:
+            state[stage.name] = fingerprints[stage.name]
+            with open(state_path, 'w') as f:
+                json.dump(state, f, indent=1)
+
+    ## schedule
+    pending = [stage for stage in stages.values() if stage.outputs]
+    lazy = set(name for name, stage in stages.items() if not stage.outputs)
+    done = set()
+    running = {}
+    with ThreadPoolExecutor(threads) as pool:
+        while pending or running:
+            for stage in [stage for stage in pending if all(dep in done or dep in lazy for dep in stage.deps)]:
+                pending.remove(stage)
+                running[pool.submit(execute, stage)] = stage.name
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                future.result()
+                done.add(running.pop(future))
+
+#----------------------
+# Stages
+#----------------------
+def build_stages(data_name,
+                 parameters,
+                 hierarchical=False,
+                 n_workers=1,
+                 img_dtype='float32',
+                 val_hours=31*24,
+                 test_hours=30*24):
+
+    """
+
+    This function is used to describe the pipeline of a dataset as stages:
+    boundary, geodata of every level, extreme split, linkages of every pair
+    of levels, attributes, images of every level and splits. Levels come
+    from the city configuration (parameters['levels'], coarse to fine; the
+    finest is split from the one before it).
+
+    """
+
+    root = f'D:/disaggregation-data/{data_name}/'
+    city = parameters['city']
+    levels = parameters['levels']
+    finest = levels[-1]
+    max_date = DATASETS[data_name]['max_date']
+    if max_date is not None: max_date = np.datetime64(max_date)
+    stages = []
+
+    ## boundary
+    stages.append(Stage('boundary', [], [stamp(parameters['boundary']), parameters['zones']], [],
+                        lambda get: get_boundary(parameters['boundary'], parameters)))
+
+    ## geodata
+    ## (a generated source, e.g. the extreme split, is tracked through its stage)
+    def geodata_stage(level, source, deps, generated=False):
+        return Stage(f'geodata:{level}', deps, [source if generated else stamp(source), city, ARTIFACT_VERSION],
+                     [root+f'geodata/{level}.parquet', root+f'geodata/{level}_grid.npz', root+f'adjacencies/{level}.npz'],
+                     lambda get: get_geodata(source, get('boundary'), data_name, level, city),
+                     lambda: load_geodata(root+f'geodata/{level}.parquet'))
+    for level in levels[:-1]:
+        stages.append(geodata_stage(level, parameters[level], ['boundary']))
+
+    ## extreme split
+    extreme_source = root+'raw-data/extreme_2010.csv'
+    stages.append(Stage('extreme', [f'geodata:{levels[-2]}'], [parameters['n_splits']], [extreme_source],
+                        lambda get: get_extreme_data(get(f'geodata:{levels[-2]}'), data_name, parameters['n_splits'], n_workers)))
+    stages.append(geodata_stage(finest, extreme_source, ['boundary', 'extreme'], generated=True))
+
+    ## linkages (every pair in one pass, see `get_linkages`)
+    pairs = [f'{low}_{high}' for low, high in itertools.combinations(levels, 2)]
+    stages.append(Stage('linkages', [f'geodata:{level}' for level in levels], [ARTIFACT_VERSION],
+                        [root+f'linkages/{pair}.npy' for pair in pairs],
+                        lambda get: get_linkages([get(f'geodata:{level}') for level in levels], levels, data_name, city),
+                        lambda: {pair: np.load(root+f'linkages/{pair}.npy') for pair in pairs}))
+    
+    ## attributes
+    def attributes(get):
+        geodatas = [get(f'geodata:{level}') for level in levels]
+        if hierarchical: linkages = [get('linkages')[f'{level}_{finest}'] for level in levels[:-1]]
+        else: linkages = None
+        stream_attributes(data_name, parameters, geodatas, levels, linkages, max_date=max_date)
+    deps = [f'geodata:{level}' for level in levels]
+    if hierarchical: deps += ['linkages']
+    files = source_years(parameters)
+    inputs = [[stamp(path) for _, path in files],
+              [source_columns(data_name, year_parameters, path) for year_parameters, path in files],
+              [date_formats(dict(parameters, year=str(year)), data_name) for year in parameters.get('years') or [parameters['year']]],
+              str(max_date),
+              [parameters.get(key) for key in ['lat_bottom', 'lat_upper', 'long_left', 'long_right']],
+              hierarchical,
+              parameters.get('partitioned', 'no')]
+    stages.append(Stage('attributes', deps, inputs,
+                        [root+'attributes/store/index.json', root+'attributes/hours.npy'],
+                        attributes))
+
+    ## images
+    def images_stage(level):
+        return Stage(f'images:{level}', ['attributes', f'geodata:{level}'], [img_dtype],
+                     [root+f'img-data/{level}_imgs.zarr', root+f'img-data/{level}_labels.npy', root+f'img-data/{level}_boundaries.npy'],
+                     lambda get: save_images(root, level, get(f'geodata:{level}'), attribute_rows(root, level, dtype='float64'), img_dtype=img_dtype))
+    for level in levels:
+        stages.append(images_stage(level))
+
+    ## splits
+    def splits(get):
+        n_hours = len(np.load(root+'attributes/hours.npy', mmap_mode='r'))
+        save_splits(root+'splits.json', n_hours, [make_splits(n_hours, val_hours, test_hours)])
+    stages.append(Stage('splits', ['attributes'], [val_hours, test_hours], [root+'splits.json'], splits))
+
+    return stages
+
+def main():
+
+    #-------------------------
+    # arguments
+    #-------------------------
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data_name', required=True, help='filename of test data. Values: taxi/bikeshare/911/chicago')
+    parser.add_argument('--hierarchical', default='no', help='join points against extreme level only & aggregate via linkages. Values: yes/no')
+    parser.add_argument('--n_workers', default='1', help='number of processes counting the raw files / splitting blocks in parallel')
+    parser.add_argument('--partitioned', default='no', help='count out of core, by spatial tile & month partitions. Values: yes/no')
+    parser.add_argument('--years', default=None, help='years to count on one continuous time axis, comma separated (default: the dataset year)')
+    parser.add_argument('--threads', default='4', help='number of stages run in parallel')
+    parser.add_argument('--img_dtype', default='float32', help='dtype of the stored images. Values: float32/float16/float64')
+    parser.add_argument('--val_hours', default='744', help='number of validation hours')
+    parser.add_argument('--test_hours', default='720', help='number of test hours')
+    parser.add_argument('--force', default='no', help='rerun every stage. Values: yes/no')
+    parser.add_argument('--profile', default=None, help="profile the first stage matching this name pattern with cProfile, e.g. 'attributes' or 'images:*'")
+    args = parser.parse_args()
+    data_name = args.data_name
+
+    #--------------------
+    # Parameters
+    #--------------------
+    print(f"Load configuration...")
+    parameters = load_parameters(data_name)
+    parameters['n_workers'] = int(args.n_workers)
+    parameters['partitioned'] = args.partitioned
+    if args.years is not None: parameters['years'] = args.years.split(',')
+
+    #--------------------
+    # Run
+    #--------------------
+    print(f"Run pipeline...")
+    start_report(f'D:/disaggregation-data/{data_name}/', 'pipeline', args.profile)
+    stages = build_stages(data_name,
+                          parameters,
+                          args.hierarchical == 'yes',
+                          int(args.n_workers),
+                          args.img_dtype,
+                          int(args.val_hours),
+                          int(args.test_hours))
+    run_pipeline(stages,
+                 f'D:/disaggregation-data/{data_name}/pipeline.json',
+                 int(args.threads),
+                 args.force == 'yes')
+    save_report('done')
+    print(f"Done!")
+
+if __name__ == "__main__":
+    main()
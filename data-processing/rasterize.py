@@ -0,0 +1,119 @@
+import numpy as np
+import shapely
+
+#----------------------
+# Label Map Function
+#----------------------
+def pixel_centers(bounds,
+                  img_size=(128,256)):
+
+    """
+
+    This function is used to get the coordinates of every pixel center of an
+    image covering `bounds` (minx, miny, maxx, maxy). Row 0 is the top
+    (north) of the image, as in the rendered images.
+
+    Arg:
+        - img_size: (width, height) in pixels, as in PIL
+
+    """
+
+    width, height = img_size
+    minx, miny, maxx, maxy = bounds
+    xs = minx + (np.arange(width)+0.5)*(maxx-minx)/width
+    ys = maxy - (np.arange(height)+0.5)*(maxy-miny)/height
+    return np.meshgrid(xs, ys)
+
+def label_map(geodata,
+              img_size=(128,256),
+              bounds=None):
+
+    """
+
+    This function is used to burn all regions of a geodata into one label
+    map: the index of the region owning every pixel, -1 for pixels outside
+    every region.
+
+    All pixel centers are joined against the regions in a single STRtree
+    query. A pixel covered by several regions (shared edges) goes to the
+    lowest region index, and a region too small to cover any pixel center
+    gets the pixel of its centroid, so every region owns at least one pixel
+    whenever possible.
+
+    Arg:
+        - geodata: regions (geometry column)
+        - img_size: (width, height) in pixels
+        - bounds: extent of the image, geodata.total_bounds by default
+
+    Returns an int32 array of shape (height, width).
+
+    """
+
+    if bounds is None: bounds = geodata.total_bounds
+    width, height = img_size
+    geometries = geodata.geometry.values
+    longs, lats = pixel_centers(bounds, img_size)
+
+    ## owner of every pixel center: lowest intersecting region
+    tree = shapely.STRtree(geometries)
+    pixel_index, region_index = tree.query(shapely.points(longs.ravel(), lats.ravel()), predicate='intersects')
+    labels = np.full(width*height, np.iinfo('int32').max, dtype='int32')
+    np.minimum.at(labels, pixel_index, region_index.astype('int32'))
+    labels[labels == np.iinfo('int32').max] = -1
+
+    ## regions without any pixel take their centroid pixel
+    n_pixels = np.bincount(labels[labels >= 0], minlength=len(geometries))
+    minx, miny, maxx, maxy = bounds
+    centroids = shapely.centroid(geometries)
+    cols = np.clip(((shapely.get_x(centroids)-minx)/(maxx-minx)*width).astype('int'), 0, width-1)
+    rows = np.clip(((maxy-shapely.get_y(centroids))/(maxy-miny)*height).astype('int'), 0, height-1)
+    for region in np.where(n_pixels == 0)[0]:
+        pixel = rows[region]*width + cols[region]
+        owner = labels[pixel]
+        if owner >= 0 and n_pixels[owner] <= 1: continue
+        if owner >= 0: n_pixels[owner] -= 1
+        labels[pixel] = region
+        n_pixels[region] = 1
+
+    return labels.reshape(height, width)
+
+#----------------------
+# Boundaries Function
+#----------------------
+def label_boundaries(labels,
+                     n_regions):
+
+    """
+
+    This function is used to derive the boundary mask of every region from
+    a label map: 0 on the region's pixels and 255 elsewhere (uint8), i.e. the
+    same layout as `{name}_boundaries.npy`.
+
+    """
+
+    boundaries = np.full((n_regions,)+labels.shape, 255, dtype='uint8')
+    rows, cols = np.where(labels >= 0)
+    boundaries[labels[rows, cols], rows, cols] = 0
+    return boundaries
+
+#----------------------
+# Count Image Function
+#----------------------
+def count_images(att,
+                 labels):
+
+    """
+
+    This function is used to turn hourly region counts into count images:
+    every pixel gets its region's count divided by the region's number of
+    pixels (count/pixel), pixels outside every region are 0. One gather
+    over all hours of `att` (hours x regions).
+
+    """
+
+    n_pixels = np.bincount(labels[labels >= 0], minlength=att.shape[1])
+    density = att / np.maximum(n_pixels, 1)
+    owned = labels >= 0
+    imgs = np.zeros((len(att),)+labels.shape)
+    imgs[:, owned] = density[:, labels[owned]]
+    return imgs
@@ -0,0 +1,103 @@
+import json
+import numpy as np
+from image_store import open_image_store
+from attribute_store import attribute_rows, load_store_index
+
+#----------------------
+# Split Windows
+#----------------------
+def make_splits(n_hours,
+                val_hours=31*24,
+                test_hours=30*24):
+
+    """
+
+    This function is used to get the default split window: the last
+    `test_hours` hours for test, the `val_hours` before them for validation
+    and everything before for training. Ranges are [start, stop) indices
+    along the hour axis.
+
+    """
+
+    test_start = n_hours - test_hours
+    val_start = test_start - val_hours
+    return {'train': [0, val_start],
+            'val': [val_start, test_start],
+            'test': [test_start, n_hours]}
+
+def rolling_splits(n_hours,
+                   train_hours,
+                   val_hours=31*24,
+                   test_hours=30*24,
+                   step_hours=7*24):
+
+    """
+
+    This function is used to get rolling split windows: a train/val/test
+    window of fixed lengths, moved forward by `step_hours` until the test
+    range reaches the last hour.
+
+    """
+
+    windows = []
+    start = 0
+    while start + train_hours + val_hours + test_hours <= n_hours:
+        val_start = start + train_hours
+        test_start = val_start + val_hours
+        windows.append({'train': [start, val_start],
+                        'val': [val_start, test_start],
+                        'test': [test_start, test_start + test_hours]})
+        start += step_hours
+    return windows
+
+#----------------------
+# Split Manifest
+#----------------------
+def save_splits(path,
+                n_hours,
+                windows):
+
+    """
+
+    This function is used to save the split manifest (splits.json): the
+    number of hours of the source arrays and the index ranges of every
+    split window. Splits are never copied, see `load_split`.
+
+    """
+
+    for window in windows:
+        for split, (start, stop) in window.items():
+            if not 0 <= start < stop <= n_hours:
+                raise ValueError(f'{split} range [{start}, {stop}) is empty or outside the {n_hours} hours')
+    with open(path, 'w') as f:
+        json.dump({'n_hours': int(n_hours), 'windows': windows}, f, indent=1)
+
+def load_splits(path,
+                window=0):
+    with open(path) as f:
+        return json.load(f)['windows'][window]
+
+def load_split(root,
+               name,
+               split,
+               window=0,
+               images=False):
+
+    """
+
+    This function is used to load one split of a resolution from the single
+    source: the split's hours of the attribute store (float32, see
+    `attribute_rows`), or of the image store img-data/{name}_imgs.zarr
+    (only the months / chunks of these hours are read).
+
+    Arg:
+        - root: dataset folder, e.g. D:/disaggregation-data/taxi/
+        - split: train/val/test
+        - window: index of the split window in splits.json
+
+    """
+
+    start, stop = load_splits(root+'splits.json', window)[split]
+    if images:
+        return open_image_store(root+f'img-data/{name}_imgs.zarr')[start:stop]
+    return attribute_rows(root, name, start, stop)
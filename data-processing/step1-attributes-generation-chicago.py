@@ -9,8 +9,22 @@ def main():
     #-------------------------
     parser = argparse.ArgumentParser()
     parser.add_argument('--data_name', required=True, help='filename of test data')
+    parser.add_argument('--hierarchical', default='no', help='join points against extreme level only & aggregate via linkages. Values: yes/no')
+    parser.add_argument('--n_workers', default='1', help='number of processes counting the raw files in parallel')
+    parser.add_argument('--incremental', default='no', help='count only raw files not in the attribute manifest & merge them into the existing attributes. Values: yes/no')
+    parser.add_argument('--partitioned', default='no', help='count out of core, by spatial tile & month partitions. Values: yes/no')
+    parser.add_argument('--attributes_npy', default='no', help='also save the attributes as dense {name}.npy arrays. Values: yes/no')
+    parser.add_argument('--profile', default=None, help="profile the first stage matching this name pattern with cProfile, e.g. 'extreme: *' or 'count raw files'")
+    parser.add_argument('--geodata_csv', default='no', help='also export geodata as WKT csv. Values: yes/no')
     args = parser.parse_args()
     data_name = args.data_name
+    hierarchical = args.hierarchical
+    n_workers = int(args.n_workers)
+    incremental = args.incremental
+    partitioned = args.partitioned
+    attributes_npy = args.attributes_npy
+    geodata_csv = args.geodata_csv == 'yes'
+    start_report(f'D:/disaggregation-data/{data_name}/', 'step1', args.profile)
        
     #--------------------
     # Parameters
@@ -22,6 +36,10 @@ def main():
         parameter_file = 'chicago-parameters.json'        
     with open(parameter_file) as json_file:
         parameters = json.load(json_file)
+    parameters['n_workers'] = n_workers
+    parameters['incremental'] = incremental
+    parameters['partitioned'] = partitioned
+    parameters['attributes_npy'] = attributes_npy
         
     print(f"Prepare boundary & extreme data...")
     community_root = parameters['community']
@@ -35,32 +53,37 @@ def main():
     # Load Geodatas
     #--------------------
     print(f"Prepare geodata...")
-    geodata_community = get_geodata(community_root, boundary, data_name, 'community')
-    geodata_tract = get_geodata(tract_root, boundary, data_name, 'tract')
-    geodata_block = get_geodata(block_root, boundary, data_name, 'block')
-    get_extreme_data(geodata_block, data_name, n_splits=2)
-    geodata_extreme = get_geodata(extreme_root, boundary, data_name, 'extreme')
+    with timer('geodata'):
+        geodata_community = get_geodata(community_root, boundary, data_name, 'community', parameters['city'], geodata_csv)
+        geodata_tract = get_geodata(tract_root, boundary, data_name, 'tract', parameters['city'], geodata_csv)
+        geodata_block = get_geodata(block_root, boundary, data_name, 'block', parameters['city'], geodata_csv)
+        get_extreme_data(geodata_block, data_name, n_splits=2, n_workers=n_workers)
+        geodata_extreme = get_geodata(extreme_root, boundary, data_name, 'extreme', parameters['city'], geodata_csv)
     
     #--------------------
     # Get Linkages
     #--------------------
     print(f"Prepare linkage...")
-    community_tract_linkage = get_linkage(geodata_community, geodata_tract, data_name, "community_tract")
-    community_block_linkage = get_linkage(geodata_community, geodata_block, data_name, "community_block")
-    community_extreme_linkage = get_linkage(geodata_community, geodata_extreme, data_name, "community_extreme")
-    tract_block_linkage = get_linkage(geodata_tract, geodata_block, data_name, "tract_block")
-    tract_block_linkage = get_linkage(geodata_tract, geodata_extreme, data_name, "tract_extreme")
-    block_extreme_linkage = get_linkage(geodata_block, geodata_extreme, data_name, "block_extreme") 
+    linkages = get_linkages([geodata_community, geodata_tract, geodata_block, geodata_extreme],
+                            ['community', 'tract', 'block', 'extreme'],
+                            data_name,
+                            parameters['city'])
     
     #--------------------
     # Get Attributes
     #--------------------
     print(f"Prepare attributes...")
-    get_attributes_chicago(parameters, 
-                           geodata_community,
-                           geodata_tract, 
-                           geodata_block,
-                           geodata_extreme)
+    with timer('attributes'):
+        if hierarchical == 'yes': extreme_linkages = [linkages['community_extreme'], linkages['tract_extreme'], linkages['block_extreme']]
+        else: extreme_linkages = None
+        get_attributes_chicago(parameters, 
+                               geodata_community,
+                               geodata_tract, 
+                               geodata_block,
+                               geodata_extreme,
+                               extreme_linkages)
+    
+    save_report('done')
     
 if __name__ == "__main__":
     main()
@@ -9,8 +9,26 @@ def main():
     #-------------------------
     parser = argparse.ArgumentParser()
     parser.add_argument('--data_name', required=True, help='filename of test data')
+    parser.add_argument('--hierarchical', default='no', help='join points against extreme level only & aggregate via linkages. Values: yes/no')
+    parser.add_argument('--n_workers', default='1', help='number of processes counting the raw files in parallel')
+    parser.add_argument('--incremental', default='no', help='count only raw files not in the attribute manifest & merge them into the existing attributes. Values: yes/no')
+    parser.add_argument('--partitioned', default='no', help='count out of core, by spatial tile & month partitions. Values: yes/no')
+    parser.add_argument('--years', default=None, help='years to count in one job, comma separated (default: the configured year), e.g. 2009,2011,2012')
+    parser.add_argument('--per_year', default='no', help='save the attributes of every year in attributes/{year}/ instead of one continuous time axis (not with --incremental). Values: yes/no')
+    parser.add_argument('--attributes_npy', default='no', help='also save the attributes as dense {name}.npy arrays. Values: yes/no')
+    parser.add_argument('--profile', default=None, help="profile the first stage matching this name pattern with cProfile, e.g. 'extreme: *' or 'count raw files'")
+    parser.add_argument('--geodata_csv', default='no', help='also export geodata as WKT csv. Values: yes/no')
     args = parser.parse_args()
     data_name = args.data_name
+    hierarchical = args.hierarchical
+    n_workers = int(args.n_workers)
+    incremental = args.incremental
+    partitioned = args.partitioned
+    attributes_npy = args.attributes_npy
+    years = args.years
+    per_year = args.per_year
+    geodata_csv = args.geodata_csv == 'yes'
+    start_report(f'D:/disaggregation-data/{data_name}/', 'step1', args.profile)
        
     #--------------------
     # Parameters
@@ -18,6 +36,11 @@ def main():
     print(f"Load configuration...")      
     with open('parameters.json') as json_file:
         parameters = json.load(json_file)
+    parameters['n_workers'] = n_workers
+    parameters['incremental'] = incremental
+    parameters['partitioned'] = partitioned
+    parameters['attributes_npy'] = attributes_npy
+    parameters['per_year'] = per_year
     if data_name == 'taxi':
         parameters['root']="D:/all-data/nyc-taxi/raw_chunk_data/"
         parameters['year']="2016"
@@ -27,6 +50,8 @@ def main():
     else: 
         parameters['root']="D:/all-data/nyc-911/911.csv"
         parameters['year']="2021"
+    if years is not None:
+        parameters['years'] = years.split(',')
     
     
     print(f"Prepare boundary...")
@@ -42,41 +67,42 @@ def main():
     # Load Geodatas
     #--------------------
     print(f"Prepare geodata...")
-    geodata_puma = get_geodata(puma_root, boundary, data_name, 'puma')
-    geodata_nta = get_geodata(nta_root, boundary, data_name, 'nta')
-    geodata_tract = get_geodata(tract_root, boundary, data_name, 'tract')
-    geodata_block = get_geodata(block_root, boundary, data_name, 'block')
-    get_extreme_data(geodata_block, data_name)
-    geodata_extreme = get_geodata(extreme_root, boundary, data_name, 'extreme')
+    with timer('geodata'):
+        geodata_puma = get_geodata(puma_root, boundary, data_name, 'puma', parameters['city'], geodata_csv)
+        geodata_nta = get_geodata(nta_root, boundary, data_name, 'nta', parameters['city'], geodata_csv)
+        geodata_tract = get_geodata(tract_root, boundary, data_name, 'tract', parameters['city'], geodata_csv)
+        geodata_block = get_geodata(block_root, boundary, data_name, 'block', parameters['city'], geodata_csv)
+        get_extreme_data(geodata_block, data_name, n_workers=n_workers)
+        geodata_extreme = get_geodata(extreme_root, boundary, data_name, 'extreme', parameters['city'], geodata_csv)
         
     #--------------------
     # Get Linkages
     #--------------------
     print(f"Prepare linkage...")
-    puma_nta_linkage = get_linkage(geodata_puma, geodata_nta, data_name, "puma_nta")
-    puma_tract_linkage = get_linkage(geodata_puma, geodata_tract, data_name, "puma_tract")
-    puma_block_linkage = get_linkage(geodata_puma, geodata_block, data_name, "puma_block")
-    puma_extreme_linkage = get_linkage(geodata_puma, geodata_extreme, data_name, "puma_extreme")
-    nta_tract_linkage = get_linkage(geodata_nta, geodata_tract, data_name, "nta_tract")
-    nta_block_linkage = get_linkage(geodata_nta, geodata_block, data_name, "nta_block")
-    nta_extreme_linkage = get_linkage(geodata_nta, geodata_extreme, data_name, "nta_extreme")
-    tract_block_linkage = get_linkage(geodata_tract, geodata_block, data_name, "tract_block")
-    tract_extreme_linkage = get_linkage(geodata_tract, geodata_extreme, data_name, "tract_extreme")
-    block_extreme_linkage = get_linkage(geodata_block, geodata_extreme, data_name, "block_extreme")  
+    linkages = get_linkages([geodata_puma, geodata_nta, geodata_tract, geodata_block, geodata_extreme],
+                            ['puma', 'nta', 'tract', 'block', 'extreme'],
+                            data_name,
+                            parameters['city'])
     
     #--------------------
     # Get Attributes
     #--------------------
     print(f"Prepare attributes...")
-    if data_name == 'taxi': extraction_function = get_attributes_taxi
-    elif data_name =='bikeshare': extraction_function = get_attributes_bikeshare
-    else: extraction_function = get_attributes_911
-    extraction_function(parameters,
-                        geodata_puma, 
-                        geodata_nta,
-                        geodata_tract, 
-                        geodata_block,
-                        geodata_extreme)
+    with timer('attributes'):
+        if data_name == 'taxi': extraction_function = get_attributes_taxi
+        elif data_name =='bikeshare': extraction_function = get_attributes_bikeshare
+        else: extraction_function = get_attributes_911
+        if hierarchical == 'yes': extreme_linkages = [linkages['puma_extreme'], linkages['nta_extreme'], linkages['tract_extreme'], linkages['block_extreme']]
+        else: extreme_linkages = None
+        extraction_function(parameters,
+                            geodata_puma, 
+                            geodata_nta,
+                            geodata_tract, 
+                            geodata_block,
+                            geodata_extreme,
+                            extreme_linkages)
+    
+    save_report('done')
     
 if __name__ == "__main__":
     main()
@@ -1,49 +1,21 @@
 import geopandas as gpd
 import argparse
-from PIL import Image
 from utils import *
 
 def load_geodata_attributes(name, root):
     
-    ## geodata
-    geodata = pd.read_csv(root+f'geodata/{name}.csv')
-    geodata['geometry'] = geodata['geometry'].apply(wkt.loads)
-    geodata = geopandas.GeoDataFrame(geodata, crs='epsg:4326')
-    
-    ## attributes
-    att = np.load(root+f'attributes/{name}.npy')
+    with timer(f'{name}: load') as record:
+        
+        ## geodata
+        if os.path.isfile(root+f'geodata/{name}.parquet'): geodata = load_geodata(root+f'geodata/{name}.parquet')
+        else: geodata = load_geodata(root+f'geodata/{name}.csv')
+        
+        ## attributes (sparse store, or dense array of older datasets)
+        att = attribute_rows(root, name, dtype='float64')
+        record['rows'] = len(att)
     
     return geodata, att
 
-def remove_boundaries_lines(boundaries):
-    
-    ## iterate each boundary
-    for bound1 in tqdm(boundaries):
-        coords1 = np.stack(np.where(bound1<255.)).T
-        coords1 = list(zip(coords1[:, 0], coords1[:, 1]))
-        
-        ## iterate neighbor boundary
-        for bound2 in boundaries:
-            coords2 = np.stack(np.where(bound2<255.)).T
-            coords2 = list(zip(coords2[:, 0], coords2[:, 1]))
-            
-            ## self
-            if coords1 == coords2:
-                continue
-            
-            ## intersection
-            intersection = list(set(coords1).intersection(set(coords2)))
-            if len(intersection) == 0:
-                continue
-            
-            for inter in intersection:
-                if len(coords1)>1:
-                    bound1[inter] = 255.
-                    coords1.remove(inter)
-                else:
-                    bound2[inter] = 255.
-    return boundaries
-    
 def main():
     
     #-------------------------
@@ -51,11 +23,17 @@ def main():
     #-------------------------
     parser = argparse.ArgumentParser()
     parser.add_argument('--data_name', required=True, help='filename of test data')
+    parser.add_argument('--img_dtype', default='float32', help='dtype of the stored images. Values: float32/float16/float64')
+    parser.add_argument('--npy', default='no', help='also save all images as one {name}_imgs_all.npy. Values: yes/no')
+    parser.add_argument('--profile', default=None, help="profile the first stage matching this name pattern with cProfile, e.g. 'extreme: count images'")
     args = parser.parse_args()
     data_name = args.data_name
+    img_dtype = args.img_dtype
+    npy = args.npy
     if data_name == 'taxi': root='D:/disaggregation-data/taxi/'
     elif data_name == 'bikeshare': root='D:/disaggregation-data/bikeshare/'
     else: root='D:/disaggregation-data/911/'
+    start_report(root, 'step2', args.profile)
     
     #--------------------
     # load geodatas
@@ -73,100 +51,18 @@ def main():
     atts = [att_puma, att_nta, att_tract, att_block, att_extreme]
     names = ['puma', 'nta', 'tract', 'block', 'extreme']
     img_size = (128,256)
-    fig_size = (1.28,2.56)
 
     #--------------------
     # iterate different resolutions
     #--------------------
-    for name in names:
+    for geodata, att, name in zip(geodatas, atts, names):
         
         print(f'Processing {name} data...')
         
-        #--------------------
-        # geodata
-        #--------------------
-        geodata = pd.read_csv(root+f'geodata/{name}.csv')
-        geodata['geometry'] = geodata['geometry'].apply(wkt.loads)
-        geodata = geopandas.GeoDataFrame(geodata, crs='epsg:4326')
-        att = np.load(root+f'attributes/{name}.npy')
-        
-        #--------------------
-        # boundaries
-        #--------------------
-        boundaries = []
-        for i in tqdm(range(len(geodata))):
-            index_array = np.zeros(len(geodata))
-            index_array[i] = 1.0
-            geodata['counts'] = index_array
-            f, ax = plt.subplots(1, figsize=fig_size)
-            ax = geodata.plot(
-                ax=ax,
-                column='counts',
-                cmap="binary")
-            ax.set_axis_off()
-            ax.margins(0)
-            ax.apply_aspect()
-            ax.figure.savefig('img.png', dpi=600, bbox_inches='tight')
-            plt.close()
-            
-            #--------------------
-            # grayscale conversion
-            #--------------------
-            boundary = Image.open('img.png').convert('L').resize(img_size)
-            boundaries.append(np.array(boundary))
-        boundaries = np.stack(boundaries)
-        
-        #--------------------
-        # Remove Boundaries
-        #--------------------
-        boundaries = remove_boundaries_lines(boundaries)
-        
-        #--------------------
-        # Attribute Images
-        #--------------------
-        imgs = []
-        for i in tqdm(range(len(att))):
-            
-            ## generate images
-            geodata['counts'] = att[i]
-            f, ax = plt.subplots(1, figsize=fig_size)
-            ax = geodata.plot(
-                ax=ax,
-                column='counts',
-                cmap="binary",
-                vmin=0)
-            ax.set_axis_off()
-            ax.margins(0)
-            ax.apply_aspect()
-            ax.figure.savefig('img.png', dpi=600, bbox_inches='tight')
-            plt.close()
-            
-            #--------------------
-            # grayscale conversion
-            #--------------------
-            img = Image.open('img.png').convert('L').resize(img_size)
-            imgs.append(np.array(img).astype('float'))
-        imgs = np.stack(imgs)
-        os.remove('img.png')
-        
-        #--------------------
-        # Pixel to Counts
-        #--------------------
-        all_bound = np.sum(boundaries<255., axis=0)
-        count_imgs = []
-        for i in tqdm(range(len(imgs))):
-            single_img = imgs[i]
-            single_att = att[i]
-            for j in range(len(boundaries)):
-                x,y=np.where(boundaries[j]<255.)
-                single_img[x,y] = single_att[j]/len(x) ## count/pixel
-            single_img[np.where(all_bound==0)] = 0
-            count_imgs.append(single_img)
-        count_imgs = np.stack(count_imgs)
-                
-        ## save image array
-        np.save(root+f'img-data/{name}_boundaries.npy', boundaries)
-        np.save(root+f'img-data/{name}_imgs_all.npy', count_imgs)
+        with timer(f'{name}: images', rows=len(att)):
+            save_images(root, name, geodata, att, img_size, img_dtype, npy == 'yes')
+    
+    save_report('done')
         
 if __name__ == "__main__":
     main()
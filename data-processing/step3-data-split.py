@@ -1,5 +1,8 @@
+import os
 import numpy as np
 import argparse
+from splits import *
+from instrument import *
 
 def main():
     
@@ -8,8 +11,19 @@ def main():
     #-------------------------
     parser = argparse.ArgumentParser()
     parser.add_argument('--data_name', required=True, help='filename of test data')
+    parser.add_argument('--val_hours', default='744', help='number of validation hours')
+    parser.add_argument('--test_hours', default='720', help='number of test hours')
+    parser.add_argument('--rolling', default='no', help='rolling split windows instead of one window. Values: yes/no')
+    parser.add_argument('--train_hours', default='2160', help='number of training hours of every rolling window')
+    parser.add_argument('--step_hours', default='168', help='shift between rolling windows')
+    parser.add_argument('--profile', default=None, help="profile the first stage matching this name pattern with cProfile, e.g. 'splits'")
     args = parser.parse_args()
     data_name = args.data_name
+    val_hours = int(args.val_hours)
+    test_hours = int(args.test_hours)
+    rolling = args.rolling
+    train_hours = int(args.train_hours)
+    step_hours = int(args.step_hours)
     
     if data_name == 'taxi': 
         root='D:/disaggregation-data/taxi/'
@@ -23,29 +37,29 @@ def main():
     else: 
         root='D:/disaggregation-data/chicago/'
         names = ['community', 'tract', 'block', 'extreme']       
+    start_report(root, 'step3', args.profile)
     
     #-------------------------
     # split
-    #-------------------------    
-    for name in names:
-        
-        print(f'Name: {name}')
-        
-        ## attributes
-        data = np.load(root+f"attributes/{name}.npy")
-        train, test = data[:-30*24], data[-30*24:]
-        train, val = train[:-31*24], train[-31*24:]
-        np.save(root+f"attributes/{name}_train.npy", train)
-        np.save(root+f"attributes/{name}_val.npy", val)
-        np.save(root+f"attributes/{name}_test.npy", test)
-        
-        ## images
-        data = np.load(root+f"img-data/{name}_imgs_all.npy")
-        train, test = data[:-30*24], data[-30*24:]
-        train, val = train[:-31*24], train[-31*24:]
-        np.save(root+f"img-data/{name}_imgs_train.npy", train)
-        np.save(root+f"img-data/{name}_imgs_val.npy", val)
-        np.save(root+f"img-data/{name}_imgs_test.npy", test)    
+    #-------------------------
+    ## hour axis of every level (store index, or header of the dense arrays)
+    if os.path.isfile(root+'attributes/store/index.json'):
+        n_hours = [load_store_index(root+'attributes/store/')['n_hours']]
+    else:
+        n_hours = [len(np.load(root+f"attributes/{name}.npy", mmap_mode='r')) for name in names]
+    if len(set(n_hours)) > 1:
+        raise ValueError(f'levels have different numbers of hours: {dict(zip(names, n_hours))}')
+    n_hours = n_hours[0]
+    
+    with timer('splits', rows=n_hours):
+        if rolling == 'yes': windows = rolling_splits(n_hours, train_hours, val_hours, test_hours, step_hours)
+        else: windows = [make_splits(n_hours, val_hours, test_hours)]
+        save_splits(root+'splits.json', n_hours, windows)
+    
+    print(f'{n_hours} hours, {len(windows)} split windows')
+    for split, (start, stop) in windows[0].items():
+        print(f'   -- {split}: [{start}, {stop})')
+    save_report('done')
         
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,63 @@
+import os
+import sys
+import pytest
+import numpy as np
+import shapely
+import geopandas
+
+## the data-processing modules are imported by name, as in the step scripts
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#----------------------
+# Synthetic City
+#----------------------
+## 2 coarse regions split into 4 fine regions, inside the taxi bbox
+BOUNDS = (-74.00, 40.72, -73.92, 40.80)
+
+def grid_regions(nx, ny, bounds=BOUNDS):
+    minx, miny, maxx, maxy = bounds
+    xs = np.linspace(minx, maxx, nx+1)
+    ys = np.linspace(miny, maxy, ny+1)
+    polygons = shapely.box(xs[:-1,None], ys[None,:-1], xs[1:,None], ys[None,1:]).ravel()
+    return geopandas.GeoDataFrame({'geometry': polygons}, crs='epsg:4326')
+
+def write_trips(path, timestamps, longs, lats):
+
+    """
+    This function is used to write a raw taxi csv (time, long, lat).
+    """
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write('time,long,lat\n')
+        for timestamp, long, lat in zip(timestamps, longs, lats):
+            f.write(f'{timestamp},{long},{lat}\n')
+
+def random_trips(n, start='2016-01-01', n_days=20, seed=0):
+    rng = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = BOUNDS
+    timestamps = np.datetime64(start, 's') + rng.integers(0, n_days*24*3600, n).astype('timedelta64[s]')
+    timestamps = [str(timestamp).replace('T', ' ') for timestamp in timestamps]
+    return timestamps, rng.uniform(minx, maxx, n), rng.uniform(miny, maxy, n)
+
+@pytest.fixture
+def city(tmp_path, monkeypatch):
+
+    """
+    A taxi dataset in tmp_path (D:/... paths are relative there): raw files
+    in raw/{year}/, the regions & linkages of 2 levels and the parameters.
+    """
+
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('D:/disaggregation-data/taxi/attributes')
+    years = [str(year) for year in range(2009, 2020)]
+    parameters = {'root': 'raw/',
+                  'year': '2016',
+                  'lat_bottom': 40.699354, 'lat_upper': 40.877803,
+                  'long_left': -74.021480, 'long_right': -73.907917,
+                  'column_names': {year: ['time', 'long', 'lat'] for year in years},
+                  'date_formats': {'taxi': {'default': '%Y-%m-%d %H:%M:%S'}}}
+    geodatas = [grid_regions(2, 1), grid_regions(2, 2)]
+    centroids = shapely.centroid(np.asarray(geodatas[1].geometry.values))
+    linkages = [shapely.contains(np.asarray(geodatas[0].geometry.values)[:,None], centroids[None,:]).astype('int8')]
+    return parameters, geodatas, ['coarse', 'fine'], linkages
@@ -0,0 +1,120 @@
+import os
+import pytest
+import numpy as np
+import utils
+from utils import stream_attributes, attribute_rows, load_manifest, geodata_key
+from attribute_store import load_store_index, load_store_month
+from conftest import write_trips, random_trips
+
+ROOT = 'D:/disaggregation-data/taxi/'
+
+def test_no_events(city):
+    
+    ## every trip outside the bbox
+    parameters, geodatas, names, _ = city
+    write_trips('raw/2016/a.csv', ['2016-01-01 10:00:00'], [-74.05], [40.72])
+    for cache in [False, True]:
+        stream_attributes('taxi', parameters, geodatas, names, cache=cache)
+        assert not os.path.exists(ROOT+'attributes/store/index.json')
+
+def test_counts(city):
+    parameters, geodatas, names, _ = city
+    write_trips('raw/2016/a.csv', *random_trips(500))
+    stream_attributes('taxi', parameters, geodatas, names)
+    coarse, fine = [attribute_rows(ROOT, name) for name in names]
+    assert coarse.sum() == fine.sum() == 500
+
+def test_incremental_recounts_on_config_change(city):
+    parameters, geodatas, names, linkages = city
+    write_trips('raw/2016/a.csv', *random_trips(500))
+    stream_attributes('taxi', parameters, geodatas, names)
+    
+    ## a new file after switching to hierarchical counts: every file is recounted
+    write_trips('raw/2016/b.csv', *random_trips(300, seed=1))
+    incremental = dict(parameters, incremental='yes')
+    stream_attributes('taxi', incremental, geodatas, names, linkages)
+    manifest = load_manifest('taxi')
+    assert manifest['config']['hierarchical'] and len(manifest['files']) == 2
+    assert attribute_rows(ROOT, 'coarse').sum() == 800
+    
+    ## same number of regions, other geometries
+    moved = [geodata.translate(xoff=0.001) for geodata in geodatas]
+    stream_attributes('taxi', incremental, moved, names, linkages)
+    assert load_manifest('taxi')['config']['geodata'] == [geodata_key(geodata) for geodata in moved]
+
+def test_per_year_by_timestamp(city):
+    
+    ## the last trips of 2016 in a raw file of 2017
+    parameters, geodatas, names, _ = city
+    write_trips('raw/2016/a.csv', *random_trips(200))
+    write_trips('raw/2017/a.csv', ['2016-12-31 23:30:00']*3 + ['2017-01-01 00:30:00']*2, [-73.95]*5, [40.75]*5)
+    per_year = dict(parameters, years=['2016', '2017'], per_year='yes')
+    stream_attributes('taxi', per_year, geodatas, names)
+    for year, n_events in [('2016', 203), ('2017', 2)]:
+        path = ROOT+f'attributes/{year}/store/'
+        months = [month for month, _, _ in load_store_index(path)['months']]
+        assert all(month.startswith(year) for month in months)
+        assert sum(load_store_month(path, 'coarse', month).sum() for month in months) == n_events
+    
+    with pytest.raises(ValueError):
+        stream_attributes('taxi', dict(per_year, incremental='yes'), geodatas, names)
+
+def test_partitioned_removes_manifest(city):
+    
+    ## a partitioned run after a streamed one: same counts, no stale manifest
+    parameters, geodatas, names, _ = city
+    write_trips('raw/2016/a.csv', *random_trips(500))
+    stream_attributes('taxi', parameters, geodatas, names)
+    streamed = attribute_rows(ROOT, 'fine')
+    assert os.path.isdir(ROOT+'attributes/partials/')
+    
+    stream_attributes('taxi', dict(parameters, partitioned='yes'), geodatas, names)
+    assert np.array_equal(attribute_rows(ROOT, 'fine'), streamed)
+    assert load_manifest('taxi') is None and not os.path.exists(ROOT+'attributes/partials/')
+
+def test_attribute_rows_ranges(tmp_path):
+    
+    ## any row range of the store reads as the dense counts
+    from scipy import sparse
+    from attribute_store import save_attribute_store, attribute_matrix
+    hours = np.arange('2016-01-30T00', '2016-03-02T00', dtype='datetime64[h]')
+    counts = sparse.random(len(hours), 7, density=0.1, random_state=0, data_rvs=lambda n: np.arange(1, n+1))
+    root = str(tmp_path)+'/'
+    save_attribute_store(root+'attributes/store/', ['fine'], [counts], hours)
+    dense = counts.toarray()
+    for start, stop in [(0, None), (10, 50), (40, 800), (700, 2000), (900, 900)]:
+        assert np.array_equal(attribute_rows(root, 'fine', start, stop, 'float64'), dense[start:stop])
+    assert np.array_equal(attribute_matrix(root, 'fine').toarray(), dense)
+
+@pytest.mark.parametrize('step', ['save_attributes', 'save_manifest'])
+def test_incremental_after_interrupted_run(city, monkeypatch, step):
+    parameters, geodatas, names, _ = city
+    timestamps, longs, lats = random_trips(500)
+    write_trips('raw/2016/a.csv', timestamps[:300], longs[:300], lats[:300])
+    incremental = dict(parameters, incremental='yes')
+    stream_attributes('taxi', incremental, geodatas, names)
+    
+    ## late rows appended, then a run killed before its store or manifest is saved
+    write_trips('raw/2016/a.csv', timestamps, longs, lats)
+    def interrupt(*args, **kwargs): raise KeyboardInterrupt
+    with monkeypatch.context() as patch:
+        patch.setattr(utils, step, interrupt)
+        with pytest.raises(KeyboardInterrupt):
+            stream_attributes('taxi', incremental, geodatas, names)
+    
+    stream_attributes('taxi', incremental, geodatas, names)
+    assert attribute_rows(ROOT, 'fine').sum() == 500
+    partials = load_manifest('taxi')['files'].values()
+    assert sorted(os.listdir(ROOT+'attributes/partials/')) == [os.path.basename(entry['partial']) for entry in partials]
+    
+    ## same as a full recount
+    counted = attribute_rows(ROOT, 'fine')
+    stream_attributes('taxi', parameters, geodatas, names)
+    assert np.array_equal(attribute_rows(ROOT, 'fine'), counted)
+
+def test_unparsable_timestamps(city):
+    parameters, geodatas, names, _ = city
+    write_trips('raw/2016/a.csv', ['01/02/2016 10:00']*3, [-73.95]*3, [40.75]*3)
+    for cache in [False, True]:
+        stream_attributes('taxi', parameters, geodatas, names, cache=cache)
+        assert not os.path.exists(ROOT+'attributes/store/index.json')
@@ -0,0 +1,34 @@
+import numpy as np
+from ingestion import load_events
+
+COLUMNS = {'time': 'time', 'lat': 'lat', 'long': 'long'}
+FORMATS = ['%Y-%m-%d %H:%M:%S']
+BBOX = (40.70, 40.88, -74.02, -73.91)
+
+def write_csv(path, rows):
+    with open(path, 'w') as f:
+        f.write('time,lat,long\n')
+        for row in rows:
+            f.write(','.join(map(str, row)) + '\n')
+    return str(path)
+
+def test_event_cache_without_events(tmp_path):
+    
+    ## every event outside the bbox (e.g. a Jersey City bikeshare file)
+    path = write_csv(tmp_path/'JC-202101.csv', [('2021-01-01 10:00:00', 40.72, -74.05),
+                                                ('2021-01-01 11:00:00', 40.73, -74.04)])
+    for _ in range(2):
+        assert list(load_events(path, COLUMNS, FORMATS, bbox=BBOX, cache_root=str(tmp_path/'events'))) == []
+
+def test_event_cache_header_only(tmp_path):
+    path = write_csv(tmp_path/'empty.csv', [])
+    assert list(load_events(path, COLUMNS, FORMATS, bbox=BBOX, cache_root=str(tmp_path/'events'))) == []
+
+def test_event_cache_many_days(tmp_path):
+    
+    ## one raw file over 4 years: more than 1024 date partitions
+    days = np.arange(np.datetime64('2019-01-01'), np.datetime64('2023-01-01'))
+    path = write_csv(tmp_path/'911.csv', [(f'{day} 12:00:00', 40.75, -73.98) for day in days])
+    events = list(load_events(path, COLUMNS, FORMATS, bbox=BBOX, cache_root=str(tmp_path/'events')))
+    timestamps = np.sort(np.concatenate([chunk['timestamp'] for chunk in events]))
+    assert np.array_equal(timestamps, days.astype('datetime64[s]') + np.timedelta64(12, 'h'))
@@ -0,0 +1,31 @@
+import os
+import json
+import threading
+from instrument import timer, start_report, save_report, REPORT, SAMPLER
+
+def test_timer_without_report(monkeypatch):
+    
+    ## library use: no sampler thread, peak of the start & end memory
+    monkeypatch.setitem(SAMPLER, 'pid', None)
+    threads = threading.active_count()
+    with timer('stage') as record:
+        pass
+    assert threading.active_count() == threads and not SAMPLER['running']
+    assert record['peak_rss'] >= record['rss'] > 0
+
+def test_timer_with_report(tmp_path, monkeypatch):
+    for key in REPORT: monkeypatch.setitem(REPORT, key, REPORT[key])
+    for key in SAMPLER: monkeypatch.setitem(SAMPLER, key, SAMPLER[key])
+    monkeypatch.setitem(SAMPLER, 'pid', None)
+    
+    path = start_report(str(tmp_path)+'/', 'test')
+    assert SAMPLER['pid'] == os.getpid()
+    with timer('stage'):
+        assert len(SAMPLER['running']) == 1
+    save_report('done')
+    with open(path) as f:
+        report = json.load(f)
+    assert report['status'] == 'done' and [stage['stage'] for stage in report['stages']] == ['stage']
+    
+    ## the sampler thread stops saving once the report is reset
+    monkeypatch.setitem(REPORT, 'path', None)
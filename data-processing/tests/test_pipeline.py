@@ -0,0 +1,29 @@
+from pipeline import build_stages, stage_fingerprints
+from conftest import write_trips, random_trips
+
+def pipeline_parameters(parameters):
+    levels = ['puma', 'nta', 'tract', 'block', 'extreme']
+    return dict(parameters, city='nyc', levels=levels, n_splits=3, boundary='zones.csv', zones=[1],
+                **{level: f'{level}.csv' for level in levels})
+
+def test_attribute_fingerprint(city):
+    parameters, _, _, _ = city
+    write_trips('raw/2016/a.csv', *random_trips(10))
+    parameters = pipeline_parameters(parameters)
+    base = stage_fingerprints(build_stages('taxi', parameters))
+    
+    ## the counting mode & raw columns invalidate the attributes
+    for changed in [stage_fingerprints(build_stages('taxi', parameters, hierarchical=True)),
+                    stage_fingerprints(build_stages('taxi', dict(parameters, partitioned='yes'))),
+                    stage_fingerprints(build_stages('taxi', dict(parameters, column_names={'2016': ['time', 'lat', 'long']})))]:
+        assert changed['attributes'] != base['attributes']
+        assert changed['images:extreme'] != base['images:extreme']
+        assert changed['linkages'] == base['linkages']
+
+def test_linkages_stage(city):
+    parameters, _, _, _ = city
+    write_trips('raw/2016/a.csv', *random_trips(10))
+    stages = {stage.name: stage for stage in build_stages('taxi', pipeline_parameters(parameters), hierarchical=True)}
+    assert not any(name.startswith('linkage:') for name in stages)
+    assert len(stages['linkages'].outputs) == 10
+    assert 'linkages' in stages['attributes'].deps
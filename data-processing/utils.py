@@ -1,30 +1,34 @@
 import os
 import json
-import time
+import shutil
+import hashlib
 import shapely
 import numpy as np
 import pandas as pd
 import geojson
 import itertools
 import geopandas
+from scipy import sparse
 import haversine as hs
 import matplotlib.pyplot as plt
 from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor
+from adjacency import *
+from artifacts import *
+from ingestion import *
+from rasterize import *
+from image_store import *
+from splits import *
+from grid_index import *
+from attribute_store import *
+from instrument import *
 from shapely import wkt
 from shapely.geometry import Polygon, Point, LineString, MultiPolygon
-from shapely.ops import linemerge, unary_union, polygonize, cascaded_union
+from shapely.ops import linemerge, unary_union, polygonize
 
 import warnings
 warnings.filterwarnings("ignore") 
 
-def change_time_format(time):
-    
-    """
-    This function is used to change time format.
-    """
-    if 'PM' in time: return str(int(time[:2])+12)
-    else: return time[:2]
-
 #----------------------
 # Get Boundary Function
 #----------------------
@@ -61,38 +65,82 @@ def get_boundary(root, parameters):
 #----------------------
 # Get Extreme Data
 #----------------------
-def get_extreme_data(geodata_block, data_name, n_splits=3):
+def split_block(geom,
+                n_splits=3,
+                max_tries=50):
+    
+    """
+    
+    This function is used to split one city block into `n_splits` extreme
+    blocks, by cutting it along lines from its centroid to `n_splits`
+    boundary points. The cut points are shifted along the boundary at most
+    `max_tries` times; if no shift gives `n_splits` polygons, the block is
+    kept whole (fallback).
+    
+    Returns the polygons and the fallback reason (None if split).
     
     """
-    Split each city block into 3 extreme blocks
+    
+    try:
+        geom = geom.buffer(0)
+        centroid = list(geom.centroid.coords)[0]
+        splits = np.array_split(list(geom.boundary.coords)[1:], n_splits)
+        for start in range(min(max_tries, min(len(p) for p in splits))):
+            line_split_collection = [LineString([centroid, p[start]]) for p in splits]
+            line_split_collection.append(geom.boundary)
+            merged_lines = shapely.ops.linemerge(line_split_collection)
+            border_lines = shapely.ops.unary_union(merged_lines)
+            polygons = shapely.ops.polygonize(border_lines)            
+            if len(polygons) == n_splits:
+                return list(polygons), None
+        return [geom], 'no split'
+    except Exception as e:
+        return [geom], f'{type(e).__name__}: {e}'
+
+def split_block_worker(args):
+    return split_block(*args)
+
+def get_extreme_data(geodata_block, data_name, n_splits=3, n_workers=1):
+    
     """
+    
+    Split each city block into 3 extreme blocks (see `split_block`), in a
+    pool of `n_workers` processes.
+    
+    The result is cached in raw-data/extreme_2010.csv, with the hash of the
+    block geometries & n_splits and the fallback blocks in
+    raw-data/extreme_2010.json: it is only regenerated when they change.
+    
+    """
+    
+    ## cache check
+    root = f'D:/disaggregation-data/{data_name}/raw-data/'
+    digest = hashlib.sha1()
+    for geom in geodata_block.geometry:
+        digest.update(shapely.to_wkb(geom))
+    key = f'{digest.hexdigest()}-{n_splits}'
+    if os.path.isfile(root+'extreme_2010.csv') and os.path.isfile(root+'extreme_2010.json'):
+        with open(root+'extreme_2010.json') as f:
+            if json.load(f)['key'] == key:
+                print(f"   -- Use cached extreme data")
+                return
         
     # generate extreme polygons
-    extreme_polygons = []
-    for geom in tqdm(geodata_block.geometry):
-        try:
-            geom = geom.buffer(0)
-            centroid = list(geom.centroid.coords)[0]
-            splits = np.array_split(list(geom.boundary.coords)[1:], n_splits)
-            start = 0
-            index = True
-            while index:
-                line_split_collection = [LineString([centroid, p[start]]) for p in splits]
-                line_split_collection.append(geom.boundary)
-                merged_lines = shapely.ops.linemerge(line_split_collection)
-                border_lines = shapely.ops.unary_union(merged_lines)
-                polygons = shapely.ops.polygonize(border_lines)            
-                if len(polygons) == n_splits:
-                    for poly in polygons:
-                        extreme_polygons.append(poly)
-                    index=False
-                else:
-                    start += 1            
-        except:
-            extreme_polygons.append(geom)
+    tasks = [(geom, n_splits) for geom in geodata_block.geometry]
+    with timer('extreme split', rows=len(tasks)):
+        if n_workers > 1:
+            with ProcessPoolExecutor(n_workers) as pool:
+                results = list(tqdm(pool.map(split_block_worker, tasks, chunksize=64), total=len(tasks)))
+        else:
+            results = [split_block_worker(task) for task in tqdm(tasks)]
+    extreme_polygons = [poly for polygons, _ in results for poly in polygons]
+    fallbacks = [{'block': i, 'reason': reason} for i, (_, reason) in enumerate(results) if reason is not None]
+    print(f"   -- {len(extreme_polygons)} extreme blocks, {len(fallbacks)} blocks kept whole")
        
     extrem_data = pd.DataFrame(extreme_polygons, columns=['the_geom'])
-    extrem_data.to_csv(f'D:/disaggregation-data/{data_name}/raw-data/extreme_2010.csv', index=False)       
+    extrem_data.to_csv(root+'extreme_2010.csv', index=False)
+    with open(root+'extreme_2010.json', 'w') as f:
+        json.dump({'key': key, 'n_splits': n_splits, 'fallbacks': fallbacks}, f, indent=1)
     
 #----------------------
 # Get GeoData Function
@@ -100,52 +148,132 @@ def get_extreme_data(geodata_block, data_name, n_splits=3):
 def get_geodata(root, 
                 boundary, 
                 data_name,
-                resolution_name):
+                resolution_name,
+                city=None,
+                csv=False):
+    
+    """
+    
+    This function is used to get the regions of one resolution within the
+    boundary, and their adjacency.
+    
+    Both are cached once per city (see `artifact_dir`), keyed by the content
+    of the raw geometry file, the boundary (i.e. the boundary file & zones)
+    and ARTIFACT_VERSION, then linked into the dataset's geodata/ and
+    adjacencies/ folders.
+    
+    Arg:
+        - root: raw geometry csv of the resolution
+        - city: city of the dataset (parameters['city']), data_name if None
+        - csv: also export the geodata as WKT csv (geodata/{resolution_name}.csv)
+    
+    Geodata is saved as GeoParquet, see `load_geodata`, with its grid
+    index (geodata/{resolution_name}_grid.npz, see `region_grid`).
+    
+    """
     
-    if os.path.isfile(f'D:/disaggregation-data/{data_name}/geodata/{resolution_name}.csv'):
-        data = pd.read_csv(f'D:/disaggregation-data/{data_name}/geodata/{resolution_name}.csv')
-        data = data.rename(columns={'the_geom':'geometry'})
-        data['geometry'] = data['geometry'].apply(wkt.loads)
-        geodata = geopandas.GeoDataFrame(data, crs='epsg:4326')    
+    key = artifact_key(file_digest(root), shapely.to_wkb(boundary))
+    cache = artifact_dir(city or data_name, 'geodata', key)
+    
+    if os.path.isdir(cache):
+        with timer(f'{resolution_name}: load geodata') as record:
+            geodata = load_geodata(cache+f'{resolution_name}.parquet')
+            record['rows'] = len(geodata)
     else:
         ## load data & make geodata
-        data = pd.read_csv(root)
-        data = data.rename(columns={'the_geom':'geometry'})
-        data['geometry'] = data['geometry'].apply(wkt.loads)
-        gdf = geopandas.GeoDataFrame(data, crs='epsg:4326')
+        with timer(f'{resolution_name}: load raw data') as record:
+            data = pd.read_csv(root)
+            record['rows'] = len(data)
+            data = data.rename(columns={'the_geom':'geometry'})
+            data['geometry'] = shapely.from_wkt(data['geometry'].values)
+            gdf = geopandas.GeoDataFrame(data, crs='epsg:4326')
         
         ## subset regions within boundary
-        geodata = []
-        for i in tqdm(range(len(gdf))):
-            geom = gdf.geometry[i]
-            if geom.is_valid == False: geom = geom.buffer(0)            
-            if geom.type == 'Polygon': multi_polygons = [geom]
-            else: multi_polygons = list(geom.geoms)            
-            for polygon in multi_polygons:
-                if boundary.contains(polygon.centroid):
-                    area = polygon.area*10**11
-                    geodata.append([polygon, area])
-        geodata = pd.DataFrame(geodata, columns=['geometry', 'shape_area'])
+        ## (split multi-polygons, keep polygons with centroid in boundary)
+        with timer(f'{resolution_name}: boundary filter', rows=len(gdf)):
+            geoms = np.asarray(gdf.geometry.values)
+            invalid = ~shapely.is_valid(geoms)
+            geoms[invalid] = shapely.buffer(geoms[invalid], 0)
+            polygons = shapely.get_parts(geoms)
+            centroids = shapely.centroid(polygons)
+            inside = shapely.contains_xy(boundary, shapely.get_x(centroids), shapely.get_y(centroids))
+            polygons = polygons[inside]
+            geodata = geopandas.GeoDataFrame({'geometry': polygons,
+                                              'shape_area': shapely.area(polygons)*10**11}, crs='epsg:4326')
+            print(f"   -- {resolution_name}: kept {len(geodata)} of {len(centroids)} polygons")
         
         ## generate geo adjacency matrix
-        geo_A = np.zeros((geodata.shape[0], geodata.shape[0]), dtype='int8')
-        for i in tqdm(range(len(geodata))):
-            for j in range(len(geodata)):
-                geo_A[i,j] = geodata.geometry[i].intersects(geodata.geometry[j])
+        ## (STRtree self-query only tests bounding-box candidates)
+        with timer(f'{resolution_name}: adjacency', rows=len(polygons)):
+            tree = shapely.STRtree(polygons)
+            row, col = tree.query(polygons, predicate='intersects')
+        
+        ## grid index for point lookups
+        with timer(f'{resolution_name}: grid index', rows=len(polygons)):
+            grid = build_grid_index(polygons)
+            GRID_INDEXES[geodata_key(geodata)] = grid
         
         ## save  
+        with timer(f'{resolution_name}: save'):
+            def build(path):
+                geodata.to_parquet(os.path.abspath(path+f'{resolution_name}.parquet'), index=False)
+                save_adjacency(path+f'{resolution_name}.npz', row, col, len(geodata))
+                save_grid_index(path+f'{resolution_name}_grid.npz', grid)
+            build_artifact(cache, build)
+    
+    link_artifact(data_name, cache+f'{resolution_name}.parquet', f'geodata/{resolution_name}.parquet')
+    link_artifact(data_name, cache+f'{resolution_name}.npz', f'adjacencies/{resolution_name}.npz')
+    link_artifact(data_name, cache+f'{resolution_name}_grid.npz', f'geodata/{resolution_name}_grid.npz')
+    
+    ## optional WKT csv export
+    if csv:
         geodata.to_csv(f'D:/disaggregation-data/{data_name}/geodata/{resolution_name}.csv',header=True,index=False)
-        np.save(f'D:/disaggregation-data/{data_name}/adjacencies/{resolution_name}.npy', geo_A)    
     
     return geodata
 
+def load_geodata(path):
+    
+    """
+    
+    This function is used to load a geodata saved by `get_geodata`: the
+    GeoParquet file (WKB geometries, decoded vectorized) & its grid index,
+    or the WKT csv of older datasets.
+    
+    """
+    
+    ## absolute path: pyarrow would read a drive letter as an URI scheme
+    if path.endswith('.parquet'):
+        geodata = geopandas.read_parquet(os.path.abspath(path))
+        grid_path = path[:-len('.parquet')] + '_grid.npz'
+        if os.path.isfile(grid_path): GRID_INDEXES[geodata_key(geodata)] = load_grid_index(grid_path)
+        return geodata
+    data = pd.read_csv(path)
+    data = data.rename(columns={'the_geom':'geometry'})
+    data['geometry'] = shapely.from_wkt(data['geometry'].values)
+    return geopandas.GeoDataFrame(data, crs='epsg:4326')
+
 #----------------------
 # Get Linkage Function
 #----------------------
+def parent_pointers(low_res_tree, 
+                    centroids):
+    
+    """
+    
+    This function is used to find, for every centroid of the super resolution
+    graph, the low resolution regions containing it (vectorized STRtree query).
+    
+    Returns (centroid_index, region_index) pairs.
+    
+    """
+    
+    return low_res_tree.query(centroids, predicate='within')
+
 def get_linkage(low_res_geodata, 
                 high_res_geodata, 
                 data_name,
-                linkage_name):
+                linkage_name,
+                city=None):
     
     """
     
@@ -155,27 +283,1239 @@ def get_linkage(low_res_geodata,
     
     """
     
-    if os.path.isfile(f'D:/disaggregation-data/{data_name}/linkages/{linkage_name}.npy'):
-        linkage = np.load(f'D:/disaggregation-data/{data_name}/linkages/{linkage_name}.npy')
-    else:
-        linkage = np.zeros((low_res_geodata.shape[0], high_res_geodata.shape[0]), dtype='int8')
-        for i in tqdm(range(len(low_res_geodata))):
-            for j in range(len(high_res_geodata)):
-                linkage[i,j] = low_res_geodata.geometry[i].contains(high_res_geodata.geometry[j].centroid)    
-        np.save(f'D:/disaggregation-data/{data_name}/linkages/{linkage_name}.npy', linkage)
+    return get_linkages([low_res_geodata, high_res_geodata], linkage_name.split('_'), data_name, city)[linkage_name]
+
+def get_linkages(geodatas,
+                 names,
+                 data_name,
+                 city=None):
+    
+    """
+    
+    This function is used to get the linkages between every pair of 
+    resolutions in one pass. Centroids and spatial indexes are built once
+    per resolution, then each finer resolution's centroids are queried 
+    against every coarser resolution.
+    
+    Linkages are cached once per city, keyed by the geometries of both
+    resolutions (see `get_geodata`), and linked into the dataset's
+    linkages/ folder.
+    
+    Arg:
+        - geodatas: list of geodata, coarse to fine
+        - names: resolution names, e.g. ['puma', 'nta', ...]
+        - city: city of the dataset (parameters['city']), data_name if None
+        
+    Returns a dict keyed by linkage name, e.g. 'puma_nta'.
     
-    return linkage
+    """
+    
+    geometries = [np.asarray(geodata.geometry.values) for geodata in geodatas]
+    geometry_keys = [geodata_key(geodata) for geodata in geodatas]
+    centroids = {}
+    trees = {}
+    
+    linkages = {}
+    with timer(f"linkages {'/'.join(names)}") as record:
+        for low, high in itertools.combinations(range(len(geodatas)), 2):
+            linkage_name = f'{names[low]}_{names[high]}'
+            cache = artifact_dir(city or data_name, 'linkage', artifact_key(geometry_keys[low], geometry_keys[high]))
+            if os.path.isdir(cache):
+                linkage = np.load(cache+f'{linkage_name}.npy')
+            else:
+                with accumulate('parent pointers', len(geometries[high])):
+                    if low not in trees: trees[low] = shapely.STRtree(geometries[low])
+                    if high not in centroids: centroids[high] = shapely.centroid(geometries[high])
+                    centroid_index, region_index = parent_pointers(trees[low], centroids[high])
+                linkage = np.zeros((len(geometries[low]), len(geometries[high])), dtype='int8')
+                linkage[region_index, centroid_index] = 1
+                build_artifact(cache, lambda path: np.save(path+f'{linkage_name}.npy', linkage))
+            link_artifact(data_name, cache+f'{linkage_name}.npy', f'linkages/{linkage_name}.npy')
+            linkages[linkage_name] = linkage
+        record['rows'] = sum(len(geometry) for geometry in geometries)
+    
+    return linkages
+
+#----------------------
+# Region Assignment
+#----------------------
+REGION_TREES = {}
+REGION_GRIDS = {}
+GRID_INDEXES = {}
+GEODATA_KEYS = {}
+
+def geodata_key(geodata):
+    
+    """
+    
+    This function is used to get the content hash of the regions of one
+    resolution (see `artifact_key`), computed once per geodata.
+    
+    """
+    
+    key = id(geodata)
+    if key not in GEODATA_KEYS:
+        GEODATA_KEYS[key] = (geodata, artifact_key(*shapely.to_wkb(np.asarray(geodata.geometry.values))))
+    return GEODATA_KEYS[key][1]
+
+def region_tree(geodata):
+    
+    """
+    
+    This function is used to get the spatial index over the regions of one
+    resolution. It is built once per geodata and reused for every chunk.
+    
+    """
+    
+    key = id(geodata)
+    if key not in REGION_TREES:
+        REGION_TREES[key] = (geodata, shapely.STRtree(np.asarray(geodata.geometry.values)))
+    return REGION_TREES[key][1]
+
+def region_grid(geodata):
+    
+    """
+    
+    This function is used to get the grid index over the regions of one
+    resolution (see `build_grid_index`) & the prepared region geometries:
+    the index saved with the geodata (see `load_geodata`), or built once
+    per geodata.
+    
+    """
+    
+    key = id(geodata)
+    if key not in REGION_GRIDS:
+        geometries = np.asarray(geodata.geometry.values)
+        grid = GRID_INDEXES.get(geodata_key(geodata))
+        if grid is None:
+            grid = GRID_INDEXES[geodata_key(geodata)] = build_grid_index(geometries)
+        shapely.prepare(geometries)
+        REGION_GRIDS[key] = (geodata, grid, geometries)
+    return REGION_GRIDS[key][1:]
+
+def assign_regions(geodata,
+                   longs,
+                   lats,
+                   chunk_size=1000000):
+    
+    """
+    
+    This function is used to assign points to the regions of one resolution,
+    chunk by chunk, with the grid index over the regions (see `grid_pairs`):
+    points in cells inside one region are looked up, only points in
+    boundary cells are tested against the regions.
+    
+    Returns (point_index, region_index) pairs; a point on a shared border
+    gets one pair per region, same as an 'intersects' `geopandas.sjoin`.
+    
+    """
+    
+    grid, geometries = region_grid(geodata)
+    point_index = [np.zeros(0, dtype='int64')]
+    region_index = [np.zeros(0, dtype='int64')]
+    for start in range(0, len(longs), chunk_size):
+        with accumulate('join', len(longs[start:start+chunk_size])):
+            pairs = grid_pairs(grid, geometries, longs[start:start+chunk_size], lats[start:start+chunk_size])
+        point_index.append(pairs[0]+start)
+        region_index.append(pairs[1])
+    
+    return np.concatenate(point_index), np.concatenate(region_index)
+
+#----------------------
+# Region Lookup
+#----------------------
+def load_lookup(data_name,
+                names):
+    
+    """
+    
+    This function is used to load the regions & grid index of every
+    resolution of a dataset (geodata/{name}.parquet & {name}_grid.npz),
+    for `lookup`.
+    
+    """
+    
+    return {name: load_geodata(f'D:/disaggregation-data/{data_name}/geodata/{name}.parquet') for name in names}
+
+def lookup(geodatas,
+           lats,
+           longs):
+    
+    """
+    
+    This function is used to find the region containing every point, in
+    every resolution (see `assign_regions`).
+    
+    Arg:
+        - geodatas: {name: geodata}, see `load_lookup`
+        - lats, longs: point coordinates
+    
+    Returns {name: region ids (int32, rows of the geodata)}: -1 outside
+    every region, the lowest id for a point on a shared border.
+    
+    """
+    
+    lats = np.asarray(lats, dtype='float')
+    longs = np.asarray(longs, dtype='float')
+    return {name: first_regions(*assign_regions(geodata, longs, lats), len(longs)) for name, geodata in geodatas.items()}
+
+#----------------------
+# Hour Index Function
+#----------------------
+def get_hour_index(dates, 
+                   times, 
+                   max_date=None):
+    
+    """
+    
+    This function is used to map each record to its row in the attribute
+    matrix: rows are all (date, time) combinations, dates outer & times inner,
+    both in sorted order. Records after `max_date` get index -1.
+    
+    """
+    
+    UNIQUE_DATES, date_index = np.unique(np.asarray(dates), return_inverse=True)
+    UNIQUE_TIME, time_index = np.unique(np.asarray(times), return_inverse=True)
+    hour_index = date_index.ravel()*len(UNIQUE_TIME) + time_index.ravel()
+    if max_date is not None:
+        n_dates = np.sum(UNIQUE_DATES <= max_date)
+        hour_index[date_index.ravel() >= n_dates] = -1
+        UNIQUE_DATES = UNIQUE_DATES[:n_dates]
+    
+    return hour_index, UNIQUE_DATES, UNIQUE_TIME
 
 #----------------------
 # Count Function
 #----------------------
-def count(geodata, 
-          hourly_data):
-    data = geopandas.sjoin(geodata, hourly_data)
-    data['index'] = data.index
-    data_count = np.zeros(len(geodata))
-    data_count[np.unique(data.index)] = data.groupby('index').count()['geometry'].values
-    return data_count
+def hourly_count(geodata,
+                 longs,
+                 lats,
+                 hour_index,
+                 n_hours):
+    
+    """
+    
+    This function is used to count points per (hour, region) in one pass:
+    points are assigned to regions once and scatter-added into a sparse
+    (hours x regions) count matrix.
+    
+    """
+    
+    point_index, region_index = assign_regions(geodata, longs, lats)
+    return count_matrix(point_index, region_index, hour_index, n_hours, len(geodata))
+
+def count_matrix(point_index,
+                 region_index,
+                 hour_index,
+                 n_hours,
+                 n_regions):
+    hours = hour_index[point_index]
+    valid = hours >= 0
+    ones = np.ones(np.sum(valid))
+    data_count = sparse.coo_matrix((ones, (hours[valid], region_index[valid])), shape=(n_hours, n_regions))
+    return data_count.tocsr()
+
+def hierarchical_count(geodatas,
+                       linkages,
+                       longs,
+                       lats,
+                       hour_index,
+                       n_hours,
+                       report):
+    
+    """
+    
+    This function is used to join points against the finest resolution only
+    and derive the coarser resolutions through the linkages, one sparse
+    matrix product per resolution. Points outside every finest region are
+    joined exactly against the coarser resolutions (fallback).
+    
+    Arg:
+        - geodatas: list of geodata, coarse to fine
+        - linkages: (coarse x finest) linkage of each coarser geodata
+        - report: dict accumulating the number of fallback points
+    
+    """
+    
+    ## finest resolution
+    finest = geodatas[-1]
+    point_index, region_index = assign_regions(finest, longs, lats)
+    X_finest = count_matrix(point_index, region_index, hour_index, n_hours, len(finest))
+    
+    ## points not in any finest region
+    matched = np.zeros(len(longs), dtype='bool')
+    matched[point_index] = True
+    fallback = np.where(~matched & (hour_index >= 0))[0]
+    report['fallback'] = report.get('fallback', 0) + len(fallback)
+    
+    return linked_counts(geodatas, linkages, X_finest, longs[fallback], lats[fallback], hour_index[fallback], n_hours)
+
+def linked_counts(geodatas,
+                  linkages,
+                  X_finest,
+                  longs,
+                  lats,
+                  hour_index,
+                  n_hours):
+    
+    """
+    
+    This function is used to derive the counts of the coarser resolutions
+    from the finest counts through the linkages, plus the exact counts of
+    the fallback points (points outside every finest region).
+    
+    """
+    
+    attributes = []
+    for geodata, linkage in zip(geodatas[:-1], linkages):
+        linkage = sparse.csr_matrix(linkage, dtype='float')
+        X = X_finest.dot(linkage.T).tocsr()
+        X = X + hourly_count(geodata, longs, lats, hour_index, n_hours)
+        attributes.append(X)
+    attributes.append(X_finest)
+    
+    return attributes
+
+def get_attributes(geodatas,
+                   longs,
+                   lats,
+                   hour_index,
+                   n_hours,
+                   linkages=None,
+                   report=None):
+    
+    """
+    
+    This function is used to get the hourly node attributes of every
+    resolution, as sparse (hours x regions) count matrices.
+    
+    Arg:
+        - geodatas: list of geodata, one per resolution (coarse to fine)
+        - longs, lats: point coordinates
+        - hour_index: attribute row of each point (see `get_hour_index`)
+        - n_hours: number of attribute rows
+        - linkages: (coarse x finest) linkages of the coarser resolutions;
+                    if given, only the finest resolution is joined
+                    (see `hierarchical_count`)
+        - report: optional dict for counting statistics
+    
+    """
+    
+    longs = np.asarray(longs, dtype='float')
+    lats = np.asarray(lats, dtype='float')
+    hour_index = np.asarray(hour_index)
+    if report is None: report = {}
+    
+    if linkages is not None:
+        return hierarchical_count(geodatas, linkages, longs, lats, hour_index, n_hours, report)
+    
+    attributes = []
+    for geodata in geodatas:
+        attributes.append(hourly_count(geodata, longs, lats, hour_index, n_hours))
+    
+    return attributes
+
+#----------------------
+# Partial Attributes
+#----------------------
+def merge_partials(partials):
+    
+    """
+    
+    This function is used to sum partial attributes computed on different
+    chunks. A partial is (UNIQUE_DATES, UNIQUE_TIME, attributes) with rows
+    ordered as in `get_hour_index`; the merged partial covers the union of
+    the dates & times.
+    
+    """
+    
+    UNIQUE_DATES = np.unique(np.concatenate([partial[0] for partial in partials]))
+    UNIQUE_TIME = np.unique(np.concatenate([partial[1] for partial in partials]))
+    n_hours = len(UNIQUE_DATES)*len(UNIQUE_TIME)
+    
+    merged = None
+    with accumulate('merge partials', len(partials)):
+        for dates, times, attributes in partials:
+            
+            ## row of each partial hour in the merged (date, time) grid
+            rows = np.searchsorted(UNIQUE_DATES, dates)[:,None]*len(UNIQUE_TIME) + np.searchsorted(UNIQUE_TIME, times)[None,:]
+            rows = rows.ravel()
+            remap = sparse.csr_matrix((np.ones(len(rows)), (rows, np.arange(len(rows)))), shape=(n_hours, len(rows)))
+            attributes = [remap.dot(X) for X in attributes]
+            
+            if merged is None: merged = attributes
+            else: merged = [X + Y for X, Y in zip(merged, attributes)]
+    
+    return UNIQUE_DATES, UNIQUE_TIME, merged
+
+def finalize_partial(partial, 
+                     max_date=None):
+    
+    """
+    
+    This function is used to turn a merged partial into the attribute
+    matrices (sparse), dropping dates after `max_date`. Also returns the
+    hour bucket (datetime64[h]) of every attribute row.
+    
+    """
+    
+    UNIQUE_DATES, UNIQUE_TIME, attributes = partial
+    if max_date is not None:
+        n_dates = np.sum(UNIQUE_DATES <= max_date)
+        attributes = [X[:n_dates*len(UNIQUE_TIME)] for X in attributes]
+        UNIQUE_DATES = UNIQUE_DATES[:n_dates]
+    hours = UNIQUE_DATES.astype('datetime64[h]')[:,None] + UNIQUE_TIME.astype('timedelta64[h]')[None,:]
+    
+    return hours.ravel(), [sparse.csr_matrix(X) for X in attributes]
+
+def count_file(path,
+               data_name,
+               parameters,
+               geodatas,
+               linkages=None,
+               boundary=None,
+               cache_root=None,
+               merge_every=16,
+               assignment_root=None):
+    
+    """
+    
+    This function is used to count the events of one raw file into partial
+    attributes (read, filter, hour buckets, region assignment, counts).
+    Memory stays bounded by one event chunk plus the file's partial.
+    
+    With linkages & `assignment_root`, the finest region of every event is
+    cached instead (see `load_assignments`), and the file is counted from
+    the cached region ids.
+    
+    Returns the partial (None if the file has no events) and a report of
+    the number of events & fallback events.
+    
+    """
+    
+    report = {'events':0, 'fallback':0}
+    if linkages is not None and assignment_root is not None:
+        assignments = load_assignments(path, data_name, parameters, geodatas[-1], boundary, cache_root, assignment_root)
+        return assignment_partial(assignments, geodatas, linkages, report), report
+    events = file_events(path, data_name, parameters, boundary, cache_root)
+    return count_events(events, geodatas, linkages, report, merge_every), report
+
+def file_events(path,
+                data_name,
+                parameters,
+                boundary=None,
+                cache_root=None):
+    
+    """
+    
+    This function is used to stream the cleaned events of one raw file of a
+    dataset (see `load_events`), with the dataset's columns, timestamp
+    formats & filters.
+    
+    """
+    
+    columns, formats, bbox, borough = event_filters(path, data_name, parameters)
+    return load_events(path, columns, formats, bbox, boundary, borough, cache_root)
+
+def event_filters(path,
+                  data_name,
+                  parameters):
+    
+    """
+    
+    This function is used to get the raw columns, timestamp formats & filters
+    (bbox, borough) of one raw file of a dataset.
+    
+    """
+    
+    formats = date_formats(parameters, data_name)
+    if 'lat_upper' in parameters: 
+        bbox = (parameters['lat_bottom'], parameters['lat_upper'], parameters['long_left'], parameters['long_right'])
+    else: 
+        bbox = None
+    if data_name == '911': borough = 'MANHATTAN'
+    else: borough = None
+    columns = source_columns(data_name, parameters, path)
+    return columns, formats, bbox, borough
+
+def count_events(events,
+                 geodatas,
+                 linkages,
+                 report,
+                 merge_every=16):
+    
+    """
+    
+    This function is used to count event chunks (see `load_events`) into
+    one partial: hour buckets, region assignment & counts per chunk, summed
+    every `merge_every` chunks. Returns None if there are no events.
+    
+    """
+    
+    partials = []
+    for chunk in events:
+        with accumulate('hour index', len(chunk['timestamp'])):
+            dates, times = hour_buckets(chunk['timestamp'])
+            hour_index, UNIQUE_DATES, UNIQUE_TIME = get_hour_index(dates, times)
+        attributes = get_attributes(geodatas, 
+                                    chunk['long'], 
+                                    chunk['lat'], 
+                                    hour_index, 
+                                    len(UNIQUE_DATES)*len(UNIQUE_TIME), 
+                                    linkages, 
+                                    report)
+        partials.append((UNIQUE_DATES, UNIQUE_TIME, attributes))
+        report['events'] += len(hour_index)
+        if len(partials) >= merge_every: partials = [merge_partials(partials)]
+    
+    if not partials: return None
+    return merge_partials(partials)
+
+#----------------------
+# Assignment Cache
+#----------------------
+## bump when the assignment code changes
+ASSIGNMENT_CACHE_VERSION = 1
+ASSIGNMENT_DTYPES = {'hours': 'int32',
+                     'region': 'int32',
+                     'extra_point': 'int64',
+                     'extra_region': 'int32',
+                     'outside_point': 'int64',
+                     'lat': 'float64',
+                     'long': 'float64'}
+
+def assign_file(path,
+                data_name,
+                parameters,
+                geodata,
+                boundary=None,
+                cache_root=None):
+    
+    """
+    
+    This function is used to assign the events of one raw file to the
+    regions of `geodata` (the finest resolution), chunk by chunk:
+    
+        - hours: hour bucket of every event (hours since 1970)
+        - region: first region of every event (-1 outside every region)
+        - extra_point, extra_region: other regions of events on shared borders
+        - outside_point, lat, long: events outside every region, kept for
+          the exact fallback (see `hierarchical_count`)
+    
+    """
+    
+    chunks = [{name: np.zeros(0, dtype=dtype) for name, dtype in ASSIGNMENT_DTYPES.items()}]
+    offset = 0
+    for events in file_events(path, data_name, parameters, boundary, cache_root):
+        n_events = len(events['timestamp'])
+        point_index, region_index = assign_regions(geodata, events['long'], events['lat'])
+        first = np.unique(point_index, return_index=True)[1]
+        extra = np.ones(len(point_index), dtype='bool')
+        extra[first] = False
+        region = np.full(n_events, -1, dtype='int32')
+        region[point_index[first]] = region_index[first]
+        outside = np.where(region < 0)[0]
+        chunks.append({'hours': events['timestamp'].astype('datetime64[h]').astype('int64').astype('int32'),
+                       'region': region,
+                       'extra_point': point_index[extra] + offset,
+                       'extra_region': region_index[extra].astype('int32'),
+                       'outside_point': outside + offset,
+                       'lat': events['lat'][outside],
+                       'long': events['long'][outside]})
+        offset += n_events
+    return {name: np.concatenate([chunk[name] for chunk in chunks]).astype(dtype) for name, dtype in ASSIGNMENT_DTYPES.items()}
+
+def assignment_meta(path,
+                    data_name,
+                    parameters,
+                    geodata,
+                    boundary=None):
+    
+    """
+    
+    This function is used to describe what the assignments of one raw file
+    depend on: the raw file (size & mtime), its columns, timestamp formats
+    & filters, the boundary and the regions (see `geodata_key`).
+    
+    """
+    
+    columns, formats, bbox, borough = event_filters(path, data_name, parameters)
+    meta = event_cache_meta(path, columns, formats, bbox, borough)
+    meta['boundary'] = None if boundary is None else artifact_key(shapely.to_wkb(boundary))
+    meta['geodata'] = geodata_key(geodata)
+    meta['assignment_version'] = ASSIGNMENT_CACHE_VERSION
+    return json.loads(json.dumps(meta))
+
+def load_assignments(path,
+                     data_name,
+                     parameters,
+                     geodata,
+                     boundary=None,
+                     cache_root=None,
+                     assignment_root=None):
+    
+    """
+    
+    This function is used to get the assignments of one raw file (see
+    `assign_file`) through the assignment cache: one npz per raw file in
+    `assignment_root`, (re)built when missing or stale (see
+    `assignment_meta`), e.g. when the geodata changed.
+    
+    """
+    
+    cache_path = event_cache_dir(assignment_root, path) + '.npz'
+    meta = assignment_meta(path, data_name, parameters, geodata, boundary)
+    if os.path.isfile(cache_path):
+        arrays = np.load(cache_path)
+        if json.loads(str(arrays['meta'])) == meta:
+            return {name: arrays[name] for name in ASSIGNMENT_DTYPES}
+    
+    assignments = assign_file(path, data_name, parameters, geodata, boundary, cache_root)
+    os.makedirs(assignment_root, exist_ok=True)
+    tmp = cache_path[:-len('.npz')] + f'.tmp-{os.getpid()}.npz'
+    np.savez(tmp, meta=json.dumps(meta), **assignments)
+    os.replace(tmp, cache_path)
+    return assignments
+
+def assignment_partial(assignments,
+                       geodatas,
+                       linkages,
+                       report):
+    
+    """
+    
+    This function is used to count the assignments of one raw file into a
+    partial (see `count_file`): the finest counts are counts of the cached
+    region ids, the coarser ones are derived through the linkages, with
+    the exact fallback for events outside every finest region.
+    
+    """
+    
+    if len(assignments['hours']) == 0: return None
+    dates, times = hour_buckets(assignments['hours'].astype('datetime64[h]'))
+    hour_index, UNIQUE_DATES, UNIQUE_TIME = get_hour_index(dates, times)
+    n_hours = len(UNIQUE_DATES)*len(UNIQUE_TIME)
+    
+    inside = np.where(assignments['region'] >= 0)[0]
+    point_index = np.concatenate([inside, assignments['extra_point']])
+    region_index = np.concatenate([assignments['region'][inside], assignments['extra_region']])
+    X_finest = count_matrix(point_index, region_index, hour_index, n_hours, len(geodatas[-1]))
+    
+    outside = assignments['outside_point']
+    report['events'] += len(hour_index)
+    report['fallback'] += len(outside)
+    attributes = linked_counts(geodatas, linkages, X_finest, assignments['long'], assignments['lat'], hour_index[outside], n_hours)
+    return UNIQUE_DATES, UNIQUE_TIME, attributes
+
+## geodatas & linkages of a pool worker, sent once per process
+WORKER = {}
+
+def init_worker(geodatas,
+                linkages,
+                boundary):
+    WORKER['geodatas'] = geodatas
+    WORKER['linkages'] = linkages
+    WORKER['boundary'] = boundary
+    WORKER.pop('tiles', None)
+
+def count_file_worker(args):
+    path, data_name, parameters, cache_root, merge_every, assignment_root = args
+    
+    ## sub-stage counters go back with the report (see `merge_counters`)
+    with counters(detach=True) as collected:
+        partial, report = count_file(path, 
+                                     data_name, 
+                                     parameters, 
+                                     WORKER['geodatas'], 
+                                     WORKER['linkages'], 
+                                     WORKER['boundary'], 
+                                     cache_root, 
+                                     merge_every,
+                                     assignment_root)
+    report['counters'] = collected
+    return partial, report
+
+def worker_pool(n_workers,
+                geodatas,
+                linkages=None,
+                boundary=None):
+    
+    """
+    
+    This function is used to get a pool of `n_workers` processes sharing the
+    geodatas, linkages & boundary (see `init_worker`), and its map. With one
+    worker, the pool is None and the map runs in this process.
+    
+    """
+    
+    if n_workers > 1:
+        pool = ProcessPoolExecutor(n_workers, initializer=init_worker, initargs=(geodatas, linkages, boundary))
+        return pool, pool.map
+    init_worker(geodatas, linkages, boundary)
+    return None, map
+
+def stream_attributes(data_name,
+                      parameters,
+                      geodatas,
+                      names,
+                      linkages=None,
+                      boundary=None,
+                      max_date=None,
+                      merge_every=16,
+                      cache=True):
+    
+    """
+    
+    This function is used to stream a dataset's events file by file and
+    chunk by chunk (see `count_file`), sum the partial attributes, then save
+    the attributes of every resolution.
+    
+    Files are counted by a pool of parameters['n_workers'] processes (1 by
+    default: in process). Partials are summed in file order, so the result
+    does not depend on the number of workers. The files of every year of
+    parameters['years'] are counted on one continuous time axis (see
+    `source_years`).
+    
+    Every counted file is recorded in the attribute manifest (see
+    `load_manifest`). With parameters['incremental'] == 'yes', only new or
+    changed raw files are counted and merged into the existing attributes.
+    Attributes are saved in the sparse attribute store, and also as dense
+    arrays with parameters['attributes_npy'] == 'yes' (see `save_attributes`).
+    With parameters['partitioned'] == 'yes', the dataset is counted out of
+    core instead (see `partitioned_attributes`), and with
+    parameters['per_year'] == 'yes', every year is saved separately (see
+    `yearly_attributes`).
+    
+    Arg:
+        - data_name: taxi/bikeshare/911/chicago
+        - geodatas, names: resolutions, coarse to fine
+        - linkages: see `hierarchical_count`
+        - boundary: optional polygon to filter events
+        - max_date: last date (datetime64[D]) to keep
+        - merge_every: number of partials kept before summing them
+        - cache: read events through the Parquet event cache in
+                 D:/disaggregation-data/{data_name}/events/ (see `load_events`),
+                 and, with linkages, the finest regions of the events through
+                 the assignment cache in assignments/ (see `load_assignments`)
+    
+    """
+    
+    if parameters.get('per_year', 'no') == 'yes':
+        return yearly_attributes(data_name, parameters, geodatas, names, linkages, boundary, max_date, merge_every, cache)
+    if parameters.get('partitioned', 'no') == 'yes':
+        return partitioned_attributes(data_name, parameters, geodatas, names, linkages, boundary, max_date, merge_every, cache)
+    
+    if cache: cache_root, assignment_root = f'D:/disaggregation-data/{data_name}/events/', f'D:/disaggregation-data/{data_name}/assignments/'
+    else: cache_root, assignment_root = None, None
+    
+    ## files to count
+    config = manifest_config(names, geodatas, max_date, linkages is not None)
+    manifest = None
+    if parameters.get('incremental', 'no') == 'yes':
+        manifest = load_manifest(data_name)
+        if manifest is not None and manifest['config'] != config:
+            print(f"   -- Regions, max date or counting mode changed, recount all files...")
+            manifest = None
+        elif manifest is not None and manifest.get('store') != store_stamp(data_name):
+            print(f"   -- Attributes saved after the manifest (interrupted run), recount all files...")
+            manifest = None
+    if manifest is None:
+        manifest = {'config': config, 'files': {}}
+        partials = []
+    else:
+        partials = [attributes_partial(data_name, names)]
+    files = [(year_parameters, path) for year_parameters, path in source_years(parameters) 
+             if manifest['files'].get(os.path.abspath(path), {}).get('stamp') != file_stamp(path)]
+    if not files:
+        print(f"   -- No new raw files")
+        return
+    print(f"   -- Count {len(files)} raw files...")
+    
+    report = {'events':0, 'fallback':0}
+    with timer('count raw files') as record:
+        pool, run = worker_pool(min(int(parameters.get('n_workers', 1)), len(files)), geodatas, linkages, boundary)
+        results = run(count_file_worker, [(path, data_name, year_parameters, cache_root, merge_every, assignment_root) for year_parameters, path in files])
+        try:
+            for (_, path), (partial, file_report) in zip(files, tqdm(results, total=len(files))):
+                report['events'] += file_report['events']
+                report['fallback'] += file_report['fallback']
+                merge_counters(file_report['counters'])
+                
+                ## a changed file replaces its previous counts
+                previous = manifest['files'].get(os.path.abspath(path))
+                if previous is not None and previous['partial'] is not None:
+                    partials.append(negate_partial(load_partial(previous['partial'])))
+                manifest['files'][os.path.abspath(path)] = record_file(data_name, path, partial, file_report)
+                
+                if partial is not None: partials.append(partial)
+                if len(partials) >= merge_every: partials = [merge_partials(partials)]
+        finally:
+            if pool is not None: pool.shutdown()
+        record['rows'] = report['events']
+    
+    print(f"   -- {report['events']} events")
+    if linkages is not None:
+        print(f"   -- {report['fallback']} events outside the finest resolution, counted by exact fallback")
+    if not partials:
+        print(f"   -- No events")
+        return
+    
+    ## store, then manifest, then old partials: an interrupted run leaves
+    ## the previous manifest & the partials it points to
+    hours, attributes = finalize_partial(merge_partials(partials), max_date)
+    save_attributes(data_name, names, attributes, hours, npy=parameters.get('attributes_npy', 'no') == 'yes')
+    manifest['store'] = store_stamp(data_name)
+    save_manifest(data_name, manifest)
+    prune_partials(data_name, manifest)
+
+#----------------------
+# Partitioned Attributes
+#----------------------
+def tile_index(geodata,
+               longs,
+               lats):
+    
+    """
+    
+    This function is used to get the spatial tile of every point: the first
+    region of `geodata` (the coarsest resolution) it falls in, -1 if none.
+    
+    """
+    
+    return first_regions(*assign_regions(geodata, longs, lats), len(longs))
+
+def tile_regions(geodatas,
+                 linkages=None):
+    
+    """
+    
+    This function is used to restrict every resolution to the regions a
+    point of each tile can fall in, i.e. the regions intersecting the tile
+    (a region containing a point of the tile intersects the tile). With
+    linkages, the coarser resolutions also keep the parents of the tile's
+    finest regions, so no linked count is dropped. Tile -1 (points outside
+    every tile) keeps all regions.
+    
+    Returns {tile: (region indices, geodatas, linkages)}, per resolution.
+    
+    """
+    
+    tiles = {-1: ([np.arange(len(geodata)) for geodata in geodatas], geodatas, linkages)}
+    for tile, polygon in enumerate(geodatas[0].geometry.values):
+        index = [np.sort(region_tree(geodata).query(polygon, predicate='intersects')) for geodata in geodatas]
+        tile_linkages = None
+        if linkages is not None:
+            linkages = [np.asarray(linkage) for linkage in linkages]
+            index[:-1] = [np.union1d(idx, np.nonzero(linkage[:,index[-1]].any(axis=1))[0]) 
+                          for idx, linkage in zip(index[:-1], linkages)]
+            tile_linkages = [linkage[np.ix_(idx, index[-1])] for idx, linkage in zip(index[:-1], linkages)]
+        tiles[tile] = (index, [geodata.iloc[idx] for geodata, idx in zip(geodatas, index)], tile_linkages)
+    return tiles
+
+def partition_file(path,
+                   data_name,
+                   parameters,
+                   geodata,
+                   partition_root,
+                   boundary=None,
+                   cache_root=None):
+    
+    """
+    
+    This function is used to write the events of one raw file into the event
+    partitions (see `write_partitions`), tiled by the regions of `geodata`
+    (see `tile_index`). Returns a report of the number of events.
+    
+    """
+    
+    report = {'events':0}
+    def tiled():
+        for events in file_events(path, data_name, parameters, boundary, cache_root):
+            events['tile'] = tile_index(geodata, events['long'], events['lat'])
+            report['events'] += len(events['tile'])
+            yield events
+    write_partitions(tiled(), partition_root, os.path.basename(event_cache_dir('', path)))
+    return report
+
+def count_partition(path,
+                    index,
+                    n_regions,
+                    geodatas,
+                    linkages=None,
+                    merge_every=16):
+    
+    """
+    
+    This function is used to count the events of one partition against the
+    regions of its tile only (see `tile_regions`), then put the counts back
+    into the columns of all regions.
+    
+    Returns the partial (None if the partition has no events) and a report
+    of the number of events & fallback events.
+    
+    """
+    
+    report = {'events':0, 'fallback':0}
+    partial = count_events(read_partition(path), geodatas, linkages, report, merge_every)
+    if partial is None: return None, report
+    
+    UNIQUE_DATES, UNIQUE_TIME, attributes = partial
+    attributes = [sparse.csr_matrix((X.data, idx[X.indices], X.indptr), shape=(X.shape[0], n)) 
+                  for X, idx, n in zip(attributes, index, n_regions)]
+    return (UNIQUE_DATES, UNIQUE_TIME, attributes), report
+
+def partition_file_worker(args):
+    path, data_name, parameters, partition_root, cache_root = args
+    with counters(detach=True) as collected:
+        report = partition_file(path, 
+                                data_name, 
+                                parameters, 
+                                WORKER['geodatas'][0], 
+                                partition_root, 
+                                WORKER['boundary'], 
+                                cache_root)
+    report['counters'] = collected
+    return report
+
+def count_partition_worker(args):
+    path, tile, merge_every = args
+    
+    ## tile regions, built once per process
+    if 'tiles' not in WORKER: 
+        WORKER['tiles'] = tile_regions(WORKER['geodatas'], WORKER['linkages'])
+    index, geodatas, linkages = WORKER['tiles'][tile]
+    n_regions = [len(geodata) for geodata in WORKER['geodatas']]
+    with counters(detach=True) as collected:
+        partial, report = count_partition(path, index, n_regions, geodatas, linkages, merge_every)
+    report['counters'] = collected
+    return partial, report
+
+def partitioned_attributes(data_name,
+                           parameters,
+                           geodatas,
+                           names,
+                           linkages=None,
+                           boundary=None,
+                           max_date=None,
+                           merge_every=16,
+                           cache=True):
+    
+    """
+    
+    This function is used to count a dataset out of core, in two passes:
+    
+        1. the events of every raw file are written into partitions by
+           spatial tile (region of the coarsest resolution) & month, in
+           D:/disaggregation-data/{data_name}/partitions/
+        2. every partition is counted against the regions of its tile only
+           (see `tile_regions`) & the partials are summed
+    
+    Both passes run on a pool of parameters['n_workers'] processes, and
+    memory stays bounded by one event chunk & one partition's partial per
+    worker. The attributes are the same as with `stream_attributes` (same
+    arguments); the counts are not recorded per raw file, so the attribute
+    manifest & its per-file partials (attributes/partials/) are removed.
+    
+    """
+    
+    root = f'D:/disaggregation-data/{data_name}/'
+    if cache: cache_root = root+'events/'
+    else: cache_root = None
+    partition_root = root+'partitions/'
+    if os.path.isdir(partition_root): shutil.rmtree(partition_root)
+    files = source_years(parameters)
+    pool, run = worker_pool(int(parameters.get('n_workers', 1)), geodatas, linkages, boundary)
+    
+    report = {'events':0, 'fallback':0}
+    partials = []
+    try:
+        ## scatter events into (tile, month) partitions
+        print(f"   -- Partition {len(files)} raw files...")
+        with timer('partition raw files') as record:
+            results = run(partition_file_worker, [(path, data_name, year_parameters, partition_root, cache_root) for year_parameters, path in files])
+            for file_report in tqdm(results, total=len(files)):
+                report['events'] += file_report['events']
+                merge_counters(file_report['counters'])
+            record['rows'] = report['events']
+        
+        ## count partitions (months after max_date are skipped)
+        partitions = list_partitions(partition_root) if os.path.isdir(partition_root) else []
+        if max_date is not None:
+            partitions = [partition for partition in partitions if np.datetime64(partition[0]) <= max_date.astype('datetime64[M]')]
+        print(f"   -- Count {len(partitions)} partitions...")
+        with timer('count partitions') as record:
+            results = run(count_partition_worker, [(path, tile, merge_every) for _, tile, path in partitions])
+            for partial, partition_report in tqdm(results, total=len(partitions)):
+                report['fallback'] += partition_report['fallback']
+                merge_counters(partition_report['counters'])
+                record['rows'] = (record['rows'] or 0) + partition_report['events']
+                if partial is not None: partials.append(partial)
+                if len(partials) >= merge_every: partials = [merge_partials(partials)]
+    finally:
+        if pool is not None: pool.shutdown()
+        if os.path.isdir(partition_root): shutil.rmtree(partition_root)
+    
+    print(f"   -- {report['events']} events")
+    if linkages is not None:
+        print(f"   -- {report['fallback']} events outside the finest resolution, counted by exact fallback")
+    if not partials:
+        print(f"   -- No events")
+        return
+    
+    hours, attributes = finalize_partial(merge_partials(partials), max_date)
+    save_attributes(data_name, names, attributes, hours, npy=parameters.get('attributes_npy', 'no') == 'yes')
+    if os.path.isfile(root+'attributes/manifest.json'): os.remove(root+'attributes/manifest.json')
+    if os.path.isdir(root+'attributes/partials/'): shutil.rmtree(root+'attributes/partials/')
+
+#----------------------
+# Yearly Attributes
+#----------------------
+def yearly_attributes(data_name,
+                      parameters,
+                      geodatas,
+                      names,
+                      linkages=None,
+                      boundary=None,
+                      max_date=None,
+                      merge_every=16,
+                      cache=True):
+    
+    """
+    
+    This function is used to count several years of a dataset in one job
+    and save every year separately, in
+    D:/disaggregation-data/{data_name}/attributes/{year}/ (same files as
+    attributes/). The raw files of all years (see `source_years`) are
+    counted by one pool of parameters['n_workers'] processes, so years are
+    counted in parallel and every process builds the region indexes once
+    for all years. Events go to the year of their timestamp, whichever
+    year folder their raw file is in (see `split_partial`). Same arguments
+    as `stream_attributes`; the counts are not recorded per raw file, so
+    parameters['incremental'] == 'yes' is not supported.
+    
+    """
+    
+    if parameters.get('incremental', 'no') == 'yes':
+        raise ValueError('per_year attributes cannot be counted incrementally, run with --incremental no')
+    root = f'D:/disaggregation-data/{data_name}/'
+    if cache: cache_root, assignment_root = root+'events/', root+'assignments/'
+    else: cache_root, assignment_root = None, None
+    files = source_years(parameters)
+    print(f"   -- Count {len(files)} raw files...")
+    
+    report = {'events':0, 'fallback':0}
+    partials = {}
+    with timer('count raw files') as record:
+        pool, run = worker_pool(min(int(parameters.get('n_workers', 1)), len(files)), geodatas, linkages, boundary)
+        results = run(count_file_worker, [(path, data_name, year_parameters, cache_root, merge_every, assignment_root) for year_parameters, path in files])
+        try:
+            for partial, file_report in tqdm(results, total=len(files)):
+                report['events'] += file_report['events']
+                report['fallback'] += file_report['fallback']
+                merge_counters(file_report['counters'])
+                if partial is None: continue
+                for year, year_partial in split_partial(partial).items():
+                    partials.setdefault(year, []).append(year_partial)
+                    if len(partials[year]) >= merge_every: partials[year] = [merge_partials(partials[year])]
+        finally:
+            if pool is not None: pool.shutdown()
+        record['rows'] = report['events']
+    
+    print(f"   -- {report['events']} events")
+    if linkages is not None:
+        print(f"   -- {report['fallback']} events outside the finest resolution, counted by exact fallback")
+    
+    for year, year_partials in sorted(partials.items()):
+        hours, attributes = finalize_partial(merge_partials(year_partials), max_date)
+        os.makedirs(root+f'attributes/{year}/', exist_ok=True)
+        save_attributes(data_name, names, attributes, hours, f'attributes/{year}', parameters.get('attributes_npy', 'no') == 'yes')
+
+def split_partial(partial):
+    
+    """
+    
+    This function is used to split a partial (see `merge_partials`) by the
+    year of its dates, e.g. a raw file of 2017 with trips of 2016-12-31.
+    Returns {year: partial}, years as strings.
+    
+    """
+    
+    UNIQUE_DATES, UNIQUE_TIME, attributes = partial
+    years = UNIQUE_DATES.astype('datetime64[Y]')
+    
+    ## rows are date-major (see `get_hour_index`): one row block per year
+    split = {}
+    for year in np.unique(years):
+        dates = np.flatnonzero(years == year)
+        start, stop = dates[0]*len(UNIQUE_TIME), (dates[-1]+1)*len(UNIQUE_TIME)
+        split[str(year)] = (UNIQUE_DATES[dates], UNIQUE_TIME, [X[start:stop] for X in attributes])
+    return split
+
+#----------------------
+# Attribute Manifest
+#----------------------
+def manifest_config(names,
+                    geodatas,
+                    max_date=None,
+                    hierarchical=False):
+    
+    """
+    
+    This function is used to describe what the counts of a manifest belong
+    to: the resolutions, their regions (content hash, see `geodata_key`),
+    the max date and the counting mode (flat or hierarchical), so changing
+    any of them recounts every file.
+    
+    """
+    
+    return {'names': list(names),
+            'regions': [len(geodata) for geodata in geodatas],
+            'geodata': [geodata_key(geodata) for geodata in geodatas],
+            'max_date': None if max_date is None else str(max_date),
+            'hierarchical': bool(hierarchical)}
+
+def file_stamp(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime]
+
+def load_manifest(data_name):
+    
+    """
+    
+    This function is used to load the attribute manifest of a dataset, i.e.
+    attributes/manifest.json: the layout of the attributes and, for every
+    counted raw file, its size & mtime, date range, number of events and
+    saved partial counts (attributes/partials/), and the stamp of the
+    attribute store it describes (see `store_stamp`).
+    
+    """
+    
+    path = f'D:/disaggregation-data/{data_name}/attributes/manifest.json'
+    if not os.path.isfile(path): return None
+    with open(path) as f:
+        return json.load(f)
+
+def store_stamp(data_name):
+    
+    """
+    This function is used to get the size & mtime of the attribute store index, recorded in the manifest of the attributes it describes.
+    """
+    
+    path = f'D:/disaggregation-data/{data_name}/attributes/store/index.json'
+    if not os.path.isfile(path): return None
+    return file_stamp(path)
+
+def save_manifest(data_name,
+                  manifest):
+    
+    ## atomic: an interrupted save leaves the previous manifest
+    path = f'D:/disaggregation-data/{data_name}/attributes/manifest.json'
+    with open(path+'.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(path+'.tmp', path)
+
+def prune_partials(data_name,
+                   manifest):
+    
+    """
+    This function is used to remove the saved partials the manifest no longer points to (replaced or recounted files).
+    """
+    
+    partial_root = f'D:/disaggregation-data/{data_name}/attributes/partials/'
+    if not os.path.isdir(partial_root): return
+    kept = {os.path.abspath(entry['partial']) for entry in manifest['files'].values() if entry['partial'] is not None}
+    for name in os.listdir(partial_root):
+        if os.path.abspath(partial_root+name) not in kept: os.remove(partial_root+name)
+
+def record_file(data_name,
+                path,
+                partial,
+                report):
+    
+    """
+    
+    This function is used to save the partial counts of one raw file & get
+    its manifest entry. Every version (size & mtime) of the file gets its
+    own partial, so the one of the previous manifest is kept until the new
+    manifest is saved (see `prune_partials`).
+    
+    """
+    
+    entry = {'stamp': file_stamp(path), 'events': report['events'], 'partial': None, 'dates': None}
+    if partial is None or len(partial[0]) == 0: return entry
+    size, mtime = entry['stamp']
+    entry['partial'] = event_cache_dir(f'D:/disaggregation-data/{data_name}/attributes/partials/', path) + f'-{size}-{int(mtime*1e6)}.npz'
+    entry['dates'] = [str(partial[0][0]), str(partial[0][-1])]
+    save_partial(entry['partial'], partial)
+    return entry
+
+def save_partial(path,
+                 partial):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    UNIQUE_DATES, UNIQUE_TIME, attributes = partial
+    arrays = {'dates': UNIQUE_DATES, 'times': UNIQUE_TIME}
+    for i, X in enumerate(attributes):
+        X = sparse.csr_matrix(X)
+        arrays[f'data_{i}'], arrays[f'indices_{i}'], arrays[f'indptr_{i}'] = X.data, X.indices, X.indptr
+        arrays[f'shape_{i}'] = np.array(X.shape)
+    np.savez(path, **arrays)
+
+def load_partial(path):
+    arrays = np.load(path)
+    n_levels = sum(1 for name in arrays.files if name.startswith('data_'))
+    attributes = [sparse.csr_matrix((arrays[f'data_{i}'], arrays[f'indices_{i}'], arrays[f'indptr_{i}']), 
+                                    shape=tuple(arrays[f'shape_{i}']))
+                  for i in range(n_levels)]
+    return arrays['dates'], arrays['times'], attributes
+
+def negate_partial(partial):
+    UNIQUE_DATES, UNIQUE_TIME, attributes = partial
+    return UNIQUE_DATES, UNIQUE_TIME, [-X for X in attributes]
+
+def attributes_partial(data_name,
+                       names):
+    
+    """
+    
+    This function is used to load the saved attributes as a partial, with
+    the (date, time) grid read from attributes/hours.npy, so new counts can
+    be merged into them (see `merge_partials`).
+    
+    """
+    
+    root = f'D:/disaggregation-data/{data_name}/'
+    hours = np.load(root+'attributes/hours.npy')
+    UNIQUE_DATES = np.unique(hours.astype('datetime64[D]'))
+    UNIQUE_TIME = np.unique((hours - hours.astype('datetime64[D]')).astype('int64'))
+    attributes = [attribute_matrix(root, name) for name in names]
+    return UNIQUE_DATES, UNIQUE_TIME, attributes
+
+def save_attributes(data_name, 
+                    names, 
+                    attributes,
+                    hours=None,
+                    folder='attributes',
+                    npy=False):
+    
+    """
+    
+    This function is used to save the attributes of every resolution in
+    D:/disaggregation-data/{data_name}/{folder}/: the hours (hours.npy) and
+    the sparse attribute store (store/, see `save_attribute_store`), or
+    the dense arrays ({name}.npy) if `npy` or without hours.
+    
+    """
+    
+    path = f'D:/disaggregation-data/{data_name}/{folder}/'
+    with timer(f'{folder}: save', rows=sum(attribute.shape[0] for attribute in attributes)):
+        if hours is not None:
+            np.save(path+'hours.npy', hours)
+            save_attribute_store(path+'store/', names, attributes, hours)
+        for name, attribute in zip(names, attributes):
+            if npy or hours is None:
+                np.save(path+f'{name}.npy', attribute.toarray() if sparse.issparse(attribute) else attribute)
+            elif os.path.isfile(path+f'{name}.npy'):
+                os.remove(path+f'{name}.npy')
 
 #----------------------
 # Get Attribute Function
@@ -185,7 +1525,8 @@ def get_attributes_taxi(parameters,
                         geodata_nta,
                         geodata_tract,
                         geodata_block,
-                        geodata_extreme):
+                        geodata_extreme,
+                        linkages=None):
     
     """
     
@@ -194,128 +1535,19 @@ def get_attributes_taxi(parameters,
     
     Arg:
         - parameters: configuration of year information
+        - linkages: (coarse x extreme) linkages; if given, coarser
+                    counts are derived from the extreme counts
         
     """
     
-    ## load parameters 
-    year = parameters['year']
-    root = parameters['root']
-    column_names = parameters['column_names']
-    uni_columns = parameters['uni_columns']
-    lat_upper = parameters['lat_upper']
-    lat_bottom = parameters['lat_bottom']
-    long_right = parameters['long_right']
-    long_left = parameters['long_left']
-    
-    ## change geodata from pd.Dataframe to geo.Dataframe
-    geodata_puma = geopandas.GeoDataFrame(geodata_puma, geometry='geometry')
-    geodata_nta = geopandas.GeoDataFrame(geodata_nta, geometry='geometry')
-    geodata_tract = geopandas.GeoDataFrame(geodata_tract, geometry='geometry')
-    geodata_block = geopandas.GeoDataFrame(geodata_block, geometry='geometry')
-    geodata_extreme = geopandas.GeoDataFrame(geodata_extreme, geometry='geometry')
-    
-    ## load all data
-    X_puma = []
-    X_nta = []
-    X_tract = []
-    X_block = []
-    X_extreme = []
-    
-    print(f"   -- Load {year} data...")
-    dirt = root + year + '/'
-    files = os.listdir(dirt)
-    variables = column_names[year]
-    
-    whole_data = []
-    for file in files:
-        
-        data = pd.read_csv(dirt + file)
-        data = data[variables]
-        data.columns = uni_columns
-        
-        ## subset data to regions of our interest
-        ## (for faster processing purpose as well)        
-        data = data.loc[(data.lat<= lat_upper) &\
-                        (data.lat>= lat_bottom) &\
-                        (data.long<= long_right) &\
-                        (data.long>= long_left)]
-        data = geopandas.GeoDataFrame(data, geometry=geopandas.points_from_xy(data.long, data.lat))
-        whole_data.append(data.values)
-    whole_data = pd.DataFrame(np.concatenate(whole_data), columns=uni_columns+['geometry'])
-    whole_data = geopandas.GeoDataFrame(whole_data, geometry='geometry')
-    
-    ## extract date & time
-    if year != '2016':
-        dates = [record[5:10] for record in whole_data.pickup_datetime]
-        times = [record[11:13] for record in whole_data.pickup_datetime]
-        whole_data['date'] = dates
-        whole_data['time'] = times
-    else:
-        dates = [record[:5] for record in whole_data.pickup_datetime]
-        times = [record[11:13]+record[-2:] for record in whole_data.pickup_datetime]
-        times = np.array(list(map(change_time_format, times)))
-        
-        ## 12 -> 12AM; should be changed to 00
-        ## 24 -> 12PM; should stay as 12
-        times[times == '12'] = '00'
-        times[times == '24'] = '12'
-        whole_data['date'] = dates
-        whole_data['time'] = times
-        
-    ## unique dates & unique times & segmentations
-    UNIQUE_DATES = np.unique(dates)
-    UNIQUE_TIME = np.unique(times)
-    
-    ## attribute data
-    print(f"   -- Prepare {year} node attributes...")
+    years = parameters.get('years') or [parameters['year']]
+    print(f"   -- Load & count {', '.join(map(str, years))} data...")
+    stream_attributes('taxi',
+                      parameters,
+                      [geodata_puma, geodata_nta, geodata_tract, geodata_block, geodata_extreme],
+                      ['puma', 'nta', 'tract', 'block', 'extreme'],
+                      linkages)
     
-    for uni_date in tqdm(UNIQUE_DATES):
-        for uni_time in UNIQUE_TIME:
-
-            ## subset data
-            query = f"date == '{uni_date}' & time == '{uni_time}'"
-            hourly_data = whole_data.query(query)
-                
-            if len(hourly_data)>0:
-                
-                puma_count = count(geodata_puma, hourly_data)
-                nta_count = count(geodata_nta, hourly_data)
-                tract_count = count(geodata_tract, hourly_data)
-                block_count = count(geodata_block, hourly_data)
-                extreme_count = count(geodata_extreme, hourly_data)
-    
-                X_puma.append(puma_count)
-                X_nta.append(nta_count)
-                X_tract.append(tract_count)
-                X_block.append(block_count)
-                X_extreme.append(extreme_count)
-                
-            else:
-                puma_count = np.zeros(len(geodata_puma))
-                nta_count = np.zeros(len(geodata_nta))
-                tract_count = np.zeros(len(geodata_tract))
-                block_count = np.zeros(len(geodata_block))
-                extreme_count = np.zeros(len(geodata_extreme))
-                
-                X_puma.append(puma_count)
-                X_nta.append(nta_count)
-                X_tract.append(tract_count)
-                X_block.append(block_count)
-                X_extreme.append(extreme_count)    
-    
-    ## stack data
-    X_puma = np.stack(X_puma)
-    X_nta = np.stack(X_nta)
-    X_tract = np.stack(X_tract)
-    X_block = np.stack(X_block)
-    X_extreme = np.stack(X_extreme)
-        
-    np.save(f'D:/disaggregation-data/taxi/attributes/puma.npy', X_puma)
-    np.save(f'D:/disaggregation-data/taxi/attributes/nta.npy', X_nta)
-    np.save(f'D:/disaggregation-data/taxi/attributes/tract.npy', X_tract)
-    np.save(f'D:/disaggregation-data/taxi/attributes/block.npy', X_block)
-    np.save(f'D:/disaggregation-data/taxi/attributes/extreme.npy', X_extreme)
-        
     print(f"Done!")
     
     
@@ -327,127 +1559,29 @@ def get_attributes_bikeshare(parameters,
                              geodata_nta,
                              geodata_tract,
                              geodata_block,
-                             geodata_extreme):
+                             geodata_extreme,
+                             linkages=None):
     
     """
     
-    This function is used to process each year's taxi data and
+    This function is used to process each year's bikeshare data and
     get node attributes in the graph.
     
     Arg:
         - parameters: configuration of year information
+        - linkages: (coarse x extreme) linkages; if given, coarser
+                    counts are derived from the extreme counts
         
     """
     
-    ## load parameters 
-    year = parameters['year']
-    root = parameters['root']
-    column_names = parameters['column_names']
-    uni_columns = parameters['uni_columns']
-    lat_upper = parameters['lat_upper']
-    lat_bottom = parameters['lat_bottom']
-    long_right = parameters['long_right']
-    long_left = parameters['long_left']
-    
-    ## change geodata from pd.Dataframe to geo.Dataframe
-    geodata_puma = geopandas.GeoDataFrame(geodata_puma, geometry='geometry')
-    geodata_nta = geopandas.GeoDataFrame(geodata_nta, geometry='geometry')
-    geodata_tract = geopandas.GeoDataFrame(geodata_tract, geometry='geometry')
-    geodata_block = geopandas.GeoDataFrame(geodata_block, geometry='geometry')
-    geodata_extreme = geopandas.GeoDataFrame(geodata_extreme, geometry='geometry')
-    
-    ## load all data
-    X_puma = []
-    X_nta = []
-    X_tract = []
-    X_block = []
-    X_extreme = []
-    
-    print(f"   -- Load {year} data...")
-    dirt = root + str(year) + '/'
-    files = os.listdir(dirt)
-    
-    ## get variable names
-    variables = [
-        ['starttime', 'start station latitude', 'start station longitude'],
-        ['started_at', 'start_lat', 'start_lng']
-    ]
-    uni_columns = ['time', 'lat', 'long']
-    
-    ## iterate each chunk file
-    whole_data = []
-    for i in range(len(files)):
-        file = files[i]
-        data = pd.read_csv(dirt + file)
-        try: data = data[variables[0]]
-        except: data = data[variables[1]]
-        data.columns = uni_columns
-        data = data.loc[(data.lat<= lat_upper) &\
-                        (data.lat>= lat_bottom) &\
-                        (data.long<= long_right) &\
-                        (data.long>= long_left)]
-        data = geopandas.GeoDataFrame(data, geometry=geopandas.points_from_xy(data.long, data.lat))
-        whole_data.append(data.values)
-    whole_data = pd.DataFrame(np.concatenate(whole_data), columns=uni_columns+['geometry'])
-    whole_data = geopandas.GeoDataFrame(whole_data, geometry='geometry')
-    
-    ## unique dates & hours
-    dates = [record.split()[0] for record in whole_data.time]
-    hours = [record.split()[1].split(':')[0] for record in whole_data.time]
-    whole_data['date'] = dates
-    whole_data['time'] = hours
-    UNIQUE_DATES = np.unique(dates)
-    UNIQUE_TIME = np.unique(hours)
-    UNIQUE_DATES = np.array(UNIQUE_DATES)[np.array(UNIQUE_DATES)<='2021-06-30']
-    
-    ## iterate unique date & time
-    for uni_date in tqdm(UNIQUE_DATES):
-        for uni_time in UNIQUE_TIME:
-            
-            ## subset data
-            query = f"date == '{uni_date}' & time == '{uni_time}'"
-            hourly_data = whole_data.query(query)
-            
-            if len(hourly_data)>0:
-                
-                puma_count = count(geodata_puma, hourly_data)
-                nta_count = count(geodata_nta, hourly_data)
-                tract_count = count(geodata_tract, hourly_data)
-                block_count = count(geodata_block, hourly_data)
-                extreme_count = count(geodata_extreme, hourly_data)
-    
-                X_puma.append(puma_count)
-                X_nta.append(nta_count)
-                X_tract.append(tract_count)
-                X_block.append(block_count)
-                X_extreme.append(extreme_count)
-                
-            else:
-                puma_count = np.zeros(len(geodata_puma))
-                nta_count = np.zeros(len(geodata_nta))
-                tract_count = np.zeros(len(geodata_tract))
-                block_count = np.zeros(len(geodata_block))
-                extreme_count = np.zeros(len(geodata_extreme))
-                
-                X_puma.append(puma_count)
-                X_nta.append(nta_count)
-                X_tract.append(tract_count)
-                X_block.append(block_count)
-                X_extreme.append(extreme_count)
-    
-    ## aggregate
-    X_puma = np.stack(X_puma)
-    X_nta = np.stack(X_nta)
-    X_tract = np.stack(X_tract)
-    X_block = np.stack(X_block)
-    X_extreme = np.stack(X_extreme)
-        
-    ## save data
-    np.save(f'D:/disaggregation-data/bikeshare/attributes/puma.npy', X_puma)
-    np.save(f'D:/disaggregation-data/bikeshare/attributes/nta.npy', X_nta)
-    np.save(f'D:/disaggregation-data/bikeshare/attributes/tract.npy', X_tract)
-    np.save(f'D:/disaggregation-data/bikeshare/attributes/block.npy', X_block)
-    np.save(f'D:/disaggregation-data/bikeshare/attributes/extreme.npy', X_extreme)
+    years = parameters.get('years') or [parameters['year']]
+    print(f"   -- Load & count {', '.join(map(str, years))} data...")
+    stream_attributes('bikeshare',
+                      parameters,
+                      [geodata_puma, geodata_nta, geodata_tract, geodata_block, geodata_extreme],
+                      ['puma', 'nta', 'tract', 'block', 'extreme'],
+                      linkages,
+                      max_date=np.datetime64('2021-06-30'))
     
     print(f"Done!")
     
@@ -460,102 +1594,28 @@ def get_attributes_911(parameters,
                        geodata_nta,
                        geodata_tract,
                        geodata_block,
-                       geodata_extreme):
+                       geodata_extreme,
+                       linkages=None):
     
     """
     
-    This function is used to process each year's taxi data and
+    This function is used to process the 911 data (Manhattan only) and
     get node attributes in the graph.
     
     Arg:
         - parameters: configuration of year information
+        - linkages: (coarse x extreme) linkages; if given, coarser
+                    counts are derived from the extreme counts
         
     """
     
-    ## load parameters 
-    root = parameters['root']
-    lat_upper = parameters['lat_upper']
-    lat_bottom = parameters['lat_bottom']
-    long_right = parameters['long_right']
-    long_left = parameters['long_left']
-    
-    ## change geodata from pd.Dataframe to geo.Dataframe
-    geodata_puma = geopandas.GeoDataFrame(geodata_puma, geometry='geometry')
-    geodata_nta = geopandas.GeoDataFrame(geodata_nta, geometry='geometry')
-    geodata_tract = geopandas.GeoDataFrame(geodata_tract, geometry='geometry')
-    geodata_block = geopandas.GeoDataFrame(geodata_block, geometry='geometry')
-    geodata_extreme = geopandas.GeoDataFrame(geodata_extreme, geometry='geometry')
-    
-    ## load all data
-    X_puma = []
-    X_nta = []
-    X_tract = []
-    X_block = []
-    X_extreme = []
-    
-    data = pd.read_csv(root)
-    data = data[data.BORO_NM == 'MANHATTAN']
-    data['lat'] = data['Latitude']
-    data['long'] = data['Longitude']
-    data['date'] = data['CREATE_DATE']
-    data['time'] = [record[:2]for record in data.INCIDENT_TIME]
-    data = data.loc[(data.lat<= lat_upper) &\
-                    (data.lat>= lat_bottom) &\
-                    (data.long<= long_right) &\
-                    (data.long>= long_left)]
-    data = geopandas.GeoDataFrame(data, geometry=geopandas.points_from_xy(data.long, data.lat))
-    UNIQUE_DATES = np.unique(data['date'])
-    UNIQUE_TIME = np.unique(data['time'])
-    UNIQUE_DATES = np.array(UNIQUE_DATES)[np.array(UNIQUE_DATES)<='06/30/2022']
-    
-    ## iterate unique date & time
-    for uni_date in tqdm(UNIQUE_DATES):
-        for uni_time in UNIQUE_TIME:
-            
-            ## subset data
-            query = f"date == '{uni_date}' & time == '{uni_time}'"
-            hourly_data = data.query(query)
-            
-            if len(hourly_data)>0:
-                
-                puma_count = count(geodata_puma, hourly_data)
-                nta_count = count(geodata_nta, hourly_data)
-                tract_count = count(geodata_tract, hourly_data)
-                block_count = count(geodata_block, hourly_data)
-                extreme_count = count(geodata_extreme, hourly_data)
-    
-                X_puma.append(puma_count)
-                X_nta.append(nta_count)
-                X_tract.append(tract_count)
-                X_block.append(block_count)
-                X_extreme.append(extreme_count)
-                
-            else:
-                puma_count = np.zeros(len(geodata_puma))
-                nta_count = np.zeros(len(geodata_nta))
-                tract_count = np.zeros(len(geodata_tract))
-                block_count = np.zeros(len(geodata_block))
-                extreme_count = np.zeros(len(geodata_extreme))
-                
-                X_puma.append(puma_count)
-                X_nta.append(nta_count)
-                X_tract.append(tract_count)
-                X_block.append(block_count)
-                X_extreme.append(extreme_count)
-    
-    ## aggregate
-    X_puma = np.stack(X_puma)
-    X_nta = np.stack(X_nta)
-    X_tract = np.stack(X_tract)
-    X_block = np.stack(X_block)
-    X_extreme = np.stack(X_extreme)
-        
-    ## save data
-    np.save(f'D:/disaggregation-data/911/attributes/puma.npy', X_puma)
-    np.save(f'D:/disaggregation-data/911/attributes/nta.npy', X_nta)
-    np.save(f'D:/disaggregation-data/911/attributes/tract.npy', X_tract)
-    np.save(f'D:/disaggregation-data/911/attributes/block.npy', X_block)
-    np.save(f'D:/disaggregation-data/911/attributes/extreme.npy', X_extreme)
+    print(f"   -- Load & count data...")
+    stream_attributes('911',
+                      parameters,
+                      [geodata_puma, geodata_nta, geodata_tract, geodata_block, geodata_extreme],
+                      ['puma', 'nta', 'tract', 'block', 'extreme'],
+                      linkages,
+                      max_date=np.datetime64('2022-06-30'))
     
     print(f"Done!")
     
@@ -566,94 +1626,26 @@ def get_attributes_chicago(parameters,
                            geodata_community,
                            geodata_tract,
                            geodata_block,
-                           geodata_extreme):
+                           geodata_extreme,
+                           linkages=None):
     
     """
     
-    This function is used to process each year's taxi data and
+    This function is used to process the chicago taxi data and
     get node attributes in the graph.
     
     Arg:
         - parameters: configuration of year information
+        - linkages: (coarse x extreme) linkages; if given, coarser
+                    counts are derived from the extreme counts
         
     """
     
-    ## load parameters 
-    root = parameters['root']
-    geodata_community = geopandas.GeoDataFrame(geodata_community, geometry='geometry')
-    geodata_tract = geopandas.GeoDataFrame(geodata_tract, geometry='geometry')
-    geodata_block = geopandas.GeoDataFrame(geodata_block, geometry='geometry')
-    geodata_extreme = geopandas.GeoDataFrame(geodata_extreme, geometry='geometry')
-    
-    ## load all data
-    X_community = []
-    X_tract = []
-    X_block = []
-    X_extreme = []
-    
-    print(f"   -- Load data...")
-    data = pd.read_csv(root)
-    data = data[['Pickup Centroid Latitude', 'Pickup Centroid Longitude', 'Trip Start Timestamp']]
-    data.columns = ['lat', 'long', 'pickuptime']
-    data = data.dropna().reset_index(drop=True)
-    whole_data = geopandas.GeoDataFrame(data, geometry=geopandas.points_from_xy(data.long, data.lat))       
-    
-    ## extract date & time
-    dates = [record[:5] for record in whole_data.pickuptime]
-    times = np.array([record[11:13]+record[-2:] for record in whole_data.pickuptime])
-    times[times=='12AM'] = '00AM'
-    times[times=='12PM'] = '12'
-    times = np.array(list(map(change_time_format, times)))
-    whole_data['date'] = dates
-    whole_data['time'] = times
-    
-    ## unique dates & unique times & segmentations
-    UNIQUE_DATES = np.unique(dates)
-    UNIQUE_TIME = np.unique(times)
-    
-    ## attribute data
-    print(f"   -- Prepare node attributes...")
-    
-    for uni_date in tqdm(UNIQUE_DATES):
-        for uni_time in UNIQUE_TIME:
-
-            ## subset data
-            query = f"date == '{uni_date}' & time == '{uni_time}'"
-            hourly_data = whole_data.query(query)
-            
-            if len(hourly_data)>0:
-                
-                community_count = count(geodata_community, hourly_data)
-                tract_count = count(geodata_tract, hourly_data)
-                block_count = count(geodata_block, hourly_data)
-                extreme_count = count(geodata_extreme, hourly_data)
-    
-                X_community.append(community_count)
-                X_tract.append(tract_count)
-                X_block.append(block_count)
-                X_extreme.append(extreme_count)
-                
-            else:
-                
-                community_count = np.zeros(len(geodata_community))
-                tract_count = np.zeros(len(geodata_tract))
-                block_count = np.zeros(len(geodata_block))
-                extreme_count = np.zeros(len(geodata_extreme))
-    
-                X_community.append(community_count)
-                X_tract.append(tract_count)
-                X_block.append(block_count)
-                X_extreme.append(extreme_count)
-                    
-    ## stack data
-    X_community = np.stack(X_community)
-    X_tract = np.stack(X_tract)
-    X_block = np.stack(X_block)
-    X_extreme = np.stack(X_extreme)
-        
-    np.save(f'D:/disaggregation-data/chicago/attributes/community.npy', X_community)
-    np.save(f'D:/disaggregation-data/chicago/attributes/tract.npy', X_tract)
-    np.save(f'D:/disaggregation-data/chicago/attributes/block.npy', X_block)
-    np.save(f'D:/disaggregation-data/chicago/attributes/extreme.npy', X_extreme)
+    print(f"   -- Load & count data...")
+    stream_attributes('chicago',
+                      parameters,
+                      [geodata_community, geodata_tract, geodata_block, geodata_extreme],
+                      ['community', 'tract', 'block', 'extreme'],
+                      linkages)
         
-    print(f"Done!")    
\ No newline at end of file
+    print(f"Done!")
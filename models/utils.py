@@ -1,9 +1,30 @@
 import os
+import json
 import torch
 import numpy as np
+import importlib.util
 import torch.nn.functional as F
 os.environ["CUBLAS_WORKSPACE_CONFIG"]=":16:8"
 
+# ---------------------------
+# shared attribute store reader
+# ---------------------------
+def load_attribute_reader():
+    
+    """
+    Function to load data-processing/attribute_reader.py (numpy only) by
+    path, without adding data-processing, which has its own utils.py, to
+    the import path
+    """
+    
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data-processing', 'attribute_reader.py')
+    spec = importlib.util.spec_from_file_location('attribute_reader', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+attribute_reader = load_attribute_reader()
+
 # ---------------------------
 # seeding for reproducibility
 # ---------------------------
@@ -59,6 +80,59 @@ class taxi_data(torch.utils.data.Dataset):
     def __len__(self):
         return len(self.puma)
 
+# ---------------------
+# Load Splits
+# ---------------------
+def load_splits(path,
+                n_hours,
+                window=0):
+    
+    """
+    Function to get the index ranges of the train/val/test splits
+    from the split manifest (splits.json, see step3-data-split.py);
+    without manifest, the last 30 days are test & the 31 days before val
+    
+    Arg:
+        - path: dataset path
+        - n_hours: number of hours of the source arrays
+        - window: split window of the manifest
+    """
+    
+    if os.path.isfile(path+'/splits.json'):
+        with open(path+'/splits.json') as json_file:
+            return json.load(json_file)['windows'][window]
+    
+    ## same as `make_splits` in data-processing/splits.py, which imports
+    ## scipy (not in the models' environment): keep the two in sync
+    test_start = n_hours-30*24
+    val_start = test_start-31*24
+    return {'train': [0, val_start], 'val': [val_start, test_start], 'test': [test_start, n_hours]}
+
+def load_n_hours(path):
+    
+    """
+    Function to get the number of hours of the attributes: from the
+    attribute store index, or the dense puma array of older datasets
+    """
+    
+    if os.path.isfile(path+'/attributes/store/index.json'):
+        return attribute_reader.load_store_index(path+'/attributes/store/')['n_hours']
+    return len(np.load(path+'/attributes/puma.npy', mmap_mode='r'))
+
+def load_split(path,
+               name,
+               split,
+               splits):
+    
+    """
+    Function to load one split of one resolution as a dense float32 array,
+    reading only the months of the attribute store overlapping it (see
+    data-processing/attribute_reader.py)
+    """
+    
+    start, stop = splits[split]
+    return attribute_reader.attribute_rows(path+'/', name, start, stop)
+
 # ---------------------
 # Load Data
 # ---------------------
@@ -74,12 +148,6 @@ def load_data(parameters):
     ## data path
     path = parameters['path']
     chunk_size = parameters['chunk_size']
-    puma_path = path+'/attributes/puma'    
-    nta_path = path+'/attributes/nta'
-    tract_path = path+'/attributes/tract'
-    block_path = path+'/attributes/block'
-    extreme_path = path+'/attributes/extreme'
-    
     ## linkage path
     puma_nta_path = path+'/linkages/puma_nta.npy'
     puma_tract_path = path+'/linkages/puma_tract.npy'
@@ -92,22 +160,26 @@ def load_data(parameters):
     tract_extreme_path = path+'/linkages/tract_extreme.npy'
     block_extreme_path = path+'/linkages/block_extreme.npy'
     
+    ## split ranges
+    n_hours = load_n_hours(path)
+    splits = load_splits(path, n_hours, parameters.get('window', 0))
+    
     ## load data
-    X_puma_train = torch.from_numpy(np.load(puma_path+'_train.npy')).float()
-    X_puma_val = torch.from_numpy(np.load(puma_path+'_val.npy')).float()
-    X_puma_test = torch.from_numpy(np.load(puma_path+'_test.npy')).float()    
-    X_nta_train = torch.from_numpy(np.load(nta_path+'_train.npy')).float()
-    X_nta_val = torch.from_numpy(np.load(nta_path+'_val.npy')).float()
-    X_nta_test = torch.from_numpy(np.load(nta_path+'_test.npy')).float()        
-    X_tract_train = torch.from_numpy(np.load(tract_path+'_train.npy')).float()
-    X_tract_val = torch.from_numpy(np.load(tract_path+'_val.npy')).float()
-    X_tract_test = torch.from_numpy(np.load(tract_path+'_test.npy')).float()    
-    X_block_train = torch.from_numpy(np.load(block_path+'_train.npy')).float()
-    X_block_val = torch.from_numpy(np.load(block_path+'_val.npy')).float()
-    X_block_test = torch.from_numpy(np.load(block_path+'_test.npy')).float()        
-    X_extreme_train = torch.from_numpy(np.load(extreme_path+'_train.npy')).float()
-    X_extreme_val = torch.from_numpy(np.load(extreme_path+'_val.npy')).float()
-    X_extreme_test = torch.from_numpy(np.load(extreme_path+'_test.npy')).float()
+    X_puma_train = torch.from_numpy(load_split(path, 'puma', 'train', splits)).float()
+    X_puma_val = torch.from_numpy(load_split(path, 'puma', 'val', splits)).float()
+    X_puma_test = torch.from_numpy(load_split(path, 'puma', 'test', splits)).float()    
+    X_nta_train = torch.from_numpy(load_split(path, 'nta', 'train', splits)).float()
+    X_nta_val = torch.from_numpy(load_split(path, 'nta', 'val', splits)).float()
+    X_nta_test = torch.from_numpy(load_split(path, 'nta', 'test', splits)).float()        
+    X_tract_train = torch.from_numpy(load_split(path, 'tract', 'train', splits)).float()
+    X_tract_val = torch.from_numpy(load_split(path, 'tract', 'val', splits)).float()
+    X_tract_test = torch.from_numpy(load_split(path, 'tract', 'test', splits)).float()    
+    X_block_train = torch.from_numpy(load_split(path, 'block', 'train', splits)).float()
+    X_block_val = torch.from_numpy(load_split(path, 'block', 'val', splits)).float()
+    X_block_test = torch.from_numpy(load_split(path, 'block', 'test', splits)).float()        
+    X_extreme_train = torch.from_numpy(load_split(path, 'extreme', 'train', splits)).float()
+    X_extreme_val = torch.from_numpy(load_split(path, 'extreme', 'val', splits)).float()
+    X_extreme_test = torch.from_numpy(load_split(path, 'extreme', 'test', splits)).float()
     
     ## linkages
     puma_nta = torch.from_numpy(np.load(puma_nta_path)).float()